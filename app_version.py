@@ -5,7 +5,10 @@
 
 """Version information"""
 import datetime
+import json
+import os
 import re
+import time
 from typing import List, Optional
 
 import dateutil.parser
@@ -38,19 +41,59 @@ class ReleaseInfo:
             self.semver = match.group(1)
 
 
+def _fetch_releases(user_repo: str) -> Optional[list]:
+    """Release list JSON of the repo, or None if GitHub did not return it"""
+    url = f"https://api.github.com/repos/{user_repo}/releases"
+    # The check runs in the background, so a slow response only delays the notice
+    resp = requests.get(url, headers={"Accept": "application/vnd.github.v3+json"}, timeout=10)
+    if not resp.ok:
+        return None
+    return resp.json()
+
+
 def releases(user_repo: str) -> List[ReleaseInfo]:
     """
     Retrieves the list of releases for the provided repo. user_repo should be
     of the form "user/repo"
     """
-    url = f"https://api.github.com/repos/{user_repo}/releases"
-    # The timeout may be too fast, but it's going to hold up displaying the
-    # settings screen. Better to miss an update than hang for too long.
-    resp = requests.get(url, headers={"Accept": "application/vnd.github.v3+json"}, timeout=2)
-    if not resp.ok:
+    body = _fetch_releases(user_repo)
+    if body is None:
         return []
+    return list(map(ReleaseInfo, body))
+
 
-    body = resp.json()
+def cached_releases(user_repo: str, cache_file: str, ttl: float) -> List[ReleaseInfo]:
+    """
+    releases(), kept in cache_file for ttl seconds so most calls make no
+    request. If the request fails, an expired cached list is used instead.
+    """
+    cached = None
+    try:
+        with open(cache_file, "r", encoding="utf-8") as file:
+            cached = json.load(file)
+        if cached["repo"] != user_repo:
+            cached = None
+        elif time.time() - cached["fetched"] < ttl:
+            return list(map(ReleaseInfo, cached["releases"]))
+    except (OSError, ValueError, KeyError, TypeError):
+        cached = None
+
+    try:
+        body = _fetch_releases(user_repo)
+    except requests.exceptions.RequestException:
+        if cached is None:
+            raise
+        return list(map(ReleaseInfo, cached["releases"]))
+    if body is None:
+        return [] if cached is None else list(map(ReleaseInfo, cached["releases"]))
+
+    temp_file = cache_file + ".tmp"
+    try:
+        with open(temp_file, "w", encoding="utf-8") as file:
+            json.dump({"repo": user_repo, "fetched": time.time(), "releases": body}, file)
+        os.replace(temp_file, cache_file)
+    except OSError:
+        pass
     return list(map(ReleaseInfo, body))
 
 
@@ -116,9 +159,12 @@ def git_semver(wrv: str) -> str:
     return str(version_info)
 
 
-def latest() -> Optional[ReleaseInfo]:
-    """Retrieves the latest release info"""
-    rlist = releases("dmanusrex/TimeValidate")
+def latest(cache_file: Optional[str] = None, ttl: float = 0.0) -> Optional[ReleaseInfo]:
+    """Retrieves the latest release info, from cache_file if it is less than ttl seconds old"""
+    if cache_file is None:
+        rlist = releases("dmanusrex/TimeValidate")
+    else:
+        rlist = cached_releases("dmanusrex/TimeValidate", cache_file, ttl)
     if len(rlist) == 0:
         return None
     return highest_semver(rlist)
@@ -22,6 +22,24 @@ class appConfig:
             "output_report_file": "report.txt",  # Output Report File
             "set_country": True,  # Set Country Code
             "set_region": True,  # Set Region Code
+            "csv_file": "",  # Local Club CSV File (empty to use the online club list)
+            "merge_workers": 0,  # Input files read in parallel (0 = one per CPU)
+            "incremental_merge": True,  # Reuse the processed records of unchanged input files
+            "dedup_policy": "off",  # Duplicate clubs/entries/relays - off, first, newest or fastest copy wins
+            "group_by_club": False,  # Write clubs in club code order, each club's entries together
+            "validation": "report",  # Record validation - off, report, pad (wrong length records) or drop bad records
+            "stats_json": False,  # Also write the merge statistics to a JSON file next to the report
+            "trace_memory": False,  # Trace Python allocations for the peak memory statistics (slower)
+            "split_by_meet": False,  # Merge entries for different meets (B1 records) to separate files
+            "include_subfolders": False,  # Also merge the entry files in subfolders of the entry file directory
+            "zip_output": False,  # Write the merged SD3 file and the report into a zip file named after the output
+            "zip_level": 6,  # Deflate level of the zipped output - 1 (fastest) to 9 (smallest)
+            "watch_interval": 2.0,  # Seconds between checks of the entry file directory in watch mode
+            "watch_debounce": 5.0,  # Seconds the directory must be unchanged before a watch mode merge
+            "club_cache": True,  # Cache the online club list
+            "club_cache_ttl": 24.0,  # Hours before the cached club list is revalidated
+            "club_csv_timeout": 10.0,  # Club list download timeout in seconds
+            "update_check_ttl": 24.0,  # Hours before the cached release list is checked again for a new version
             "Theme": "System",  # Theme- System, Dark or Light
             "Scaling": "100%",  # Display Zoom Level
             "Colour": "blue",  # Colour Theme
@@ -34,6 +52,7 @@ class appConfig:
         self._config.read_dict(self._CONFIG_DEFAULTS)
         userconfdir = user_config_dir("SDIF Merge", "Swimming Canada")
         pathlib.Path(userconfdir).mkdir(parents=True, exist_ok=True)
+        self._config_dir = userconfdir
         self._CONFIG_FILE = os.path.join(userconfdir, self._CONFIG_FILE)
         self._config.read(self._CONFIG_FILE)
         client_id = self.get_str("client_id")
@@ -51,6 +70,10 @@ class appConfig:
         with open(self._CONFIG_FILE, "w") as configfile:
             self._config.write(configfile)
 
+    def get_config_dir(self) -> str:
+        """Directory holding the configuration file and local caches"""
+        return self._config_dir
+
     def get_str(self, name: str) -> str:
         """Get a string option"""
         return self._config.get(self._INI_HEADING, name)
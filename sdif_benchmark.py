@@ -0,0 +1,325 @@
+"""Synthetic SDIF entry files and a merge benchmark
+
+Generates a reproducible corpus of club entry files - plain .sd3 files and
+.zip files - with a matching local club CSV, then runs the full merge over it
+and reports the throughput and memory, in total and per merge stage.  No
+network access is needed.
+
+    python -m sdif_benchmark                         # 5, 50 and 400 club meets
+    python -m sdif_benchmark --clubs 5 25 100 400 --repeat 5 --trace-memory
+    python -m sdif_benchmark --generate DIRECTORY --clubs 50
+
+The same seed always gives the same files, so runs can be compared between
+versions of the merge.
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import zipfile
+from typing import Dict, List, NamedTuple, Optional
+
+# Appliction Specific Imports - must not pull in tkinter or customtkinter
+from config import appConfig
+from sdif_merge_core import SDIF_Merge
+from sdif_records import FIELDS, INT, RECORD_LENGTH, TIME
+
+# Individual events - distance and SDIF stroke code (1 free, 2 back, 3 breast, 4 fly, 5 IM), with a base time
+_EVENTS = (
+    (50, "1", 2600),
+    (100, "1", 5700),
+    (200, "1", 12400),
+    (400, "1", 26500),
+    (100, "2", 6400),
+    (100, "3", 7200),
+    (100, "4", 6200),
+    (200, "5", 14000),
+)
+# Relay events - distance and stroke code (6 free relay, 7 medley relay), with a base time
+_RELAYS = ((200, "6", 10500), (400, "6", 23000), (200, "7", 11800), (400, "7", 25500))
+_PROVINCES = ("AB", "BC", "MB", "NB", "NL", "NS", "ON", "PE", "QC", "SK")
+_LAST_NAMES = ("SMITH", "TREMBLAY", "MARTIN", "ROY", "WILSON", "GAGNON", "LEE", "BROWN", "TAYLOR", "CAMPBELL")
+_FIRST_NAMES = ("ALEX", "SAM", "JORDAN", "TAYLOR", "RILEY", "CASEY", "MORGAN", "AVERY", "QUINN", "JAMIE")
+
+
+class CorpusSize(NamedTuple):
+    """Shape of a generated meet"""
+
+    clubs: int
+    athletes_per_club: int = 25
+    entries_per_athlete: int = 4
+    relays_per_club: int = 4
+    zip_ratio: float = 0.5  # Share of the clubs whose entry file is zipped
+    seed: int = 1
+
+
+def _record(record_type: bytes, **values) -> bytes:
+    """One SDIF record, with the named fields set from the sdif_records layout"""
+    record = bytearray(record_type + b"1".ljust(RECORD_LENGTH - 2))
+    fields = FIELDS[record_type]
+    for name, value in values.items():
+        field = fields[name]
+        width = field.end - field.start
+        text = str(value).encode("latin-1")[:width]
+        # Numbers and times are right justified, everything else left justified
+        record[field.start : field.end] = text.rjust(width) if field.kind in (INT, TIME) else text.ljust(width)
+    return bytes(record) + b"\r\n"
+
+
+def _swim_time(hundredths: int) -> str:
+    minutes, rest = divmod(hundredths, 6000)
+    seconds = f"{rest // 100:02d}.{rest % 100:02d}"
+    return f"{minutes}:{seconds}" if minutes else seconds
+
+
+def _club_code(index: int) -> str:
+    """Four letter club code - AAAA, AAAB, ..."""
+    code = ""
+    for _ in range(4):
+        index, letter = divmod(index, 26)
+        code = chr(ord("A") + letter) + code
+    return code
+
+
+def club_entry_file(size: CorpusSize, club: int, province: str, rng: random.Random) -> bytes:
+    """Entry file of one club: A0, B1, C1, the D0/D3 entries, E0/F0 relays and a Z0 with the counts"""
+    code = _club_code(club)
+    # Some clubs come in with an out of date region or no country, for the merge to fix
+    lsc = province if rng.random() > 0.1 else rng.choice(_PROVINCES)
+    country = "CAN" if rng.random() > 0.1 else ""
+    records = [
+        _record(b"A0", sdif_version="V3", file_code="01", software_name="SDIF BENCHMARK", creation_date="01012026"),
+        _record(b"B1", meet_name="SYNTHETIC CHAMPIONSHIPS", city="OTTAWA", start_date="03012026", course="L"),
+        _record(b"C1", lsc=lsc, team=code, name=f"SYNTHETIC SWIM CLUB {code}", short_name=code, country=country),
+    ]
+    d_records = 0
+    athletes = []
+    for athlete in range(size.athletes_per_club):
+        sex = "F" if athlete % 2 else "M"
+        name = f"{rng.choice(_LAST_NAMES)}, {rng.choice(_FIRST_NAMES)}"
+        uss_number = f"{code}{club:04d}{athlete:04d}"
+        birth_date = f"{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}{rng.randint(2000, 2012)}"
+        athletes.append((name, uss_number, birth_date, sex))
+        for event_number, (distance, stroke, base) in enumerate(
+            rng.sample(_EVENTS, min(size.entries_per_athlete, len(_EVENTS)))
+        ):
+            seed_time = _swim_time(base + rng.randint(0, base // 4)) if rng.random() > 0.05 else "NT"
+            records.append(
+                _record(
+                    b"D0",
+                    name=name,
+                    uss_number=uss_number,
+                    birth_date=birth_date,
+                    sex=sex,
+                    event_sex=sex,
+                    distance=distance,
+                    stroke=stroke,
+                    event_number=event_number + 1,
+                    event_age="UNOV",
+                    seed_time=seed_time,
+                    seed_course="L",
+                )
+            )
+            d_records += 1
+        records.append(_record(b"D3", uss_number=uss_number, preferred_first_name=name.split(", ")[1]))
+        d_records += 1
+    f_records = 0
+    for relay in range(size.relays_per_club):
+        distance, stroke, base = _RELAYS[relay % len(_RELAYS)]
+        sex = "F" if relay % 2 else "M"
+        team = chr(ord("A") + relay // len(_RELAYS))
+        swimmers = [athlete for athlete in athletes if athlete[3] == sex][:4]
+        records.append(
+            _record(
+                b"E0",
+                relay_team_name=team,
+                team_code=lsc + code,
+                f0_count=len(swimmers),
+                event_sex=sex,
+                distance=distance,
+                stroke=stroke,
+                event_number=100 + relay,
+                event_age="UNOV",
+                seed_time=_swim_time(base + rng.randint(0, base // 4)),
+                seed_course="L",
+            )
+        )
+        for order, (name, uss_number, birth_date, _) in enumerate(swimmers, 1):
+            records.append(
+                _record(
+                    b"F0",
+                    team_code=lsc + code,
+                    relay_team_name=team,
+                    name=name,
+                    uss_number=uss_number,
+                    birth_date=birth_date,
+                    sex=sex,
+                    finals_order=order,
+                )
+            )
+            f_records += 1
+    records.append(
+        _record(
+            b"Z0",
+            file_code="01",
+            notes="SDIF BENCHMARK",
+            b_records=1,
+            meets=1,
+            c_records=1,
+            teams=1,
+            d_records=d_records,
+            swimmers=len(athletes),
+            e_records=size.relays_per_club,
+            f_records=f_records,
+        )
+    )
+    return b"".join(records)
+
+
+def generate_corpus(directory: str, size: CorpusSize) -> str:
+    """Write the entry files of a meet to directory, returning the path of the matching club CSV"""
+    rng = random.Random(size.seed)
+    os.makedirs(directory, exist_ok=True)
+    csv_path = os.path.join(directory, "clubs.csv")
+    with open(csv_path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["Club Code", "Club Name", "Province"])
+        for club in range(size.clubs):
+            province = _PROVINCES[club % len(_PROVINCES)]
+            writer.writerow([_club_code(club), f"Synthetic Swim Club {_club_code(club)}", province])
+            data = club_entry_file(size, club, province, rng)
+            name = f"entries_{_club_code(club)}"
+            if rng.random() < size.zip_ratio:
+                with zipfile.ZipFile(os.path.join(directory, name + ".zip"), "w", zipfile.ZIP_DEFLATED) as zfile:
+                    zfile.writestr(name + ".sd3", data)
+            else:
+                with open(os.path.join(directory, name + ".sd3"), "wb") as file:
+                    file.write(data)
+    return csv_path
+
+
+def run_merge(directory: str, csv_path: str, output_dir: str, workers: int, trace_memory: bool) -> Optional[dict]:
+    """Merge a corpus end to end, returning the merge statistics, or None if the merge failed"""
+    config = appConfig()
+    config.set_str("entry_file_directory", directory)
+    config.set_str("output_sd3_file", os.path.join(output_dir, "merged.sd3"))
+    config.set_str("output_report_file", os.path.join(output_dir, "report.txt"))
+    config.set_str("csv_file", csv_path)
+    config.set_bool("set_country", True)
+    config.set_bool("set_region", True)
+    config.set_int("merge_workers", workers)
+    # Cold merges with the default options, whatever the saved settings are
+    config.set_bool("incremental_merge", False)
+    config.set_str("dedup_policy", "off")
+    config.set_bool("group_by_club", False)
+    config.set_bool("split_by_meet", False)
+    config.set_str("validation", "report")
+    config.set_bool("stats_json", True)
+    config.set_bool("trace_memory", trace_memory)
+
+    merge = SDIF_Merge(config)
+    merge.run()
+    if not merge.success:
+        return None
+    with open(os.path.join(output_dir, "report.json")) as file:
+        return json.load(file)
+
+
+def benchmark(sizes: List[CorpusSize], repeat: int, workers: int, trace_memory: bool) -> List[dict]:
+    """Generate and merge each corpus size, keeping the fastest of the repeated merges"""
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix="sdif_benchmark_") as work_dir:
+            entry_dir = os.path.join(work_dir, "entries")
+            output_dir = os.path.join(work_dir, "output")
+            os.makedirs(output_dir)
+            csv_path = generate_corpus(entry_dir, size)
+            files = [f for f in os.listdir(entry_dir) if f.endswith((".sd3", ".zip"))]
+            input_bytes = sum(os.path.getsize(os.path.join(entry_dir, f)) for f in files)
+
+            runs = []
+            for _ in range(repeat):
+                stats = run_merge(entry_dir, csv_path, output_dir, workers, trace_memory)
+                if stats is None:
+                    raise RuntimeError(f"Merge of the {size.clubs} club corpus failed")
+                runs.append(stats)
+        best = min(runs, key=lambda stats: stats["elapsed"])
+        results.append(
+            {
+                "size": size._asdict(),
+                "files": len(files),
+                "input_bytes": input_bytes,
+                "elapsed": [stats["elapsed"] for stats in runs],
+                "median_elapsed": statistics.median(stats["elapsed"] for stats in runs),
+                "best": best,
+            }
+        )
+    return results
+
+
+def print_results(results: List[dict], out=sys.stdout) -> None:
+    """Scaling table, then the stages of the fastest merge of each size"""
+    out.write(
+        f"{'Clubs':>6}{'Files':>7}{'Input MiB':>11}{'Records':>10}{'Best s':>9}{'Median s':>10}"
+        f"{'Records/sec':>13}{'MiB/sec':>9}{'Peak MiB':>10}\n"
+    )
+    for result in results:
+        merge = result["best"]["stages"]["Merge"]
+        best = merge["seconds"]
+        peak = f"{merge['peak_memory'] / 1048576:.1f}" if merge["peak_memory"] is not None else ""
+        out.write(
+            f"{result['size']['clubs']:>6}{result['files']:>7}{result['input_bytes'] / 1048576:>11.2f}"
+            f"{merge['records']:>10}{best:>9.3f}{result['median_elapsed']:>10.3f}"
+            f"{merge['records'] / best if best else 0:>13,.0f}{merge['bytes'] / 1048576 / best if best else 0:>9.1f}"
+            f"{peak:>10}\n"
+        )
+    for result in results:
+        out.write(f"\nStages of the fastest {result['size']['clubs']} club merge (worker stages summed):\n")
+        stages: Dict[str, dict] = result["best"]["stages"]
+        for stage, totals in stages.items():
+            rate = f"{totals['records_per_second']:,}" if totals["records_per_second"] and totals["records"] else ""
+            line = f"  {stage:<16}{totals['seconds']:>9.3f}s{totals['bytes'] / 1048576:>9.2f} MiB{rate:>14}"
+            out.write(line.rstrip() + "\n")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="sdif_benchmark", description="Benchmark the SDIF merge on synthetic meets")
+    parser.add_argument("--clubs", type=int, nargs="+", default=[5, 50, 400], help="Meet sizes to run, in clubs")
+    parser.add_argument("--athletes", type=int, default=25, help="Athletes per club")
+    parser.add_argument("--entries", type=int, default=4, help="Individual entries per athlete")
+    parser.add_argument("--relays", type=int, default=4, help="Relay teams per club")
+    parser.add_argument("--zip-ratio", type=float, default=0.5, help="Share of the entry files that are zipped")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed of the generated files")
+    parser.add_argument("--repeat", type=int, default=3, help="Merges per size - the fastest is reported")
+    parser.add_argument("--workers", type=int, default=0, help="Merge worker threads (0 = one per CPU)")
+    parser.add_argument("--trace-memory", action="store_true", help="Peak memory from traced Python allocations")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    parser.add_argument("--generate", metavar="DIRECTORY", help="Only write the corpus of the first size to DIRECTORY")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s - %(message)s")
+    sizes = [
+        CorpusSize(clubs, args.athletes, args.entries, args.relays, args.zip_ratio, args.seed) for clubs in args.clubs
+    ]
+
+    if args.generate:
+        csv_path = generate_corpus(args.generate, sizes[0])
+        print(f"Wrote {sizes[0].clubs} club entry files and {csv_path}")
+        return 0
+
+    results = benchmark(sizes, max(args.repeat, 1), args.workers, args.trace_memory)
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
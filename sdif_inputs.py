@@ -0,0 +1,269 @@
+"""Discovery of the entry files to merge and streaming of nested zip files
+
+Entry files are .sd3 files and .zip files holding .sd3 members, matched
+without regard to case.  Bulk exports often hold zip files inside a zip
+file; zipfile needs to seek to the central directory at the end of an
+archive, which for a compressed member means decompressing it again for
+every member opened.  Nested archives are instead read front to back from
+their local file headers by stream_zip(), member by member, so a nested
+archive is decompressed once per pass and never held in memory or
+extracted to disk.
+"""
+
+import os
+import re
+import struct
+import zipfile
+import zlib
+from typing import Callable, Iterator, List, Optional, Tuple
+
+# Entry file names - matched case insensitively, anchored at the end of the name
+SD3_NAME = re.compile(r"\.sd3\Z", re.IGNORECASE)
+ZIP_NAME = re.compile(r"\.zip\Z", re.IGNORECASE)
+INPUT_NAME = re.compile(r"\.(?:sd3|zip)\Z", re.IGNORECASE)
+
+_LOCAL_HEADER = struct.Struct("<4sHHHHHLLLHH")
+_LOCAL_SIGNATURE = b"PK\x03\x04"
+_DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+_ZIP64_EXTRA = 0x0001
+_ZIP64_LIMIT = 0xFFFFFFFF
+_FLAG_ENCRYPTED = 0x0001
+_FLAG_DESCRIPTOR = 0x0008
+_FLAG_UTF8 = 0x0800
+_CHUNK_SIZE = 64 * 1024
+
+# Compression methods that can be streamed - zipfile reads bzip2 and LZMA too, but only from a seekable file
+STREAMED_METHODS = (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+
+
+def find_input_files(
+    directory: str, recursive: bool = False, exclude: Optional[Callable[[str], bool]] = None
+) -> List[str]:
+    """Entry files in directory (and its subfolders if recursive), as sorted paths relative to directory
+
+    exclude is called with the full path of each candidate file - files it
+    returns True for, such as the merge's own output, are left out.
+    Hidden folders are not searched.
+    """
+
+    def failed(error: OSError) -> None:
+        # Unreadable subfolders are passed over, but the directory itself has to be readable
+        if os.path.normpath(error.filename) == os.path.normpath(directory):
+            raise error
+
+    found = []
+    for root, folders, files in os.walk(directory, onerror=failed):
+        if recursive:
+            folders[:] = sorted(folder for folder in folders if not folder.startswith("."))
+        else:
+            folders.clear()
+        for name in files:
+            path = os.path.join(root, name)
+            if INPUT_NAME.search(name) and not (exclude is not None and exclude(path)):
+                found.append(os.path.relpath(path, directory))
+    # Sorted so the merge order doesn't depend on the file system
+    return sorted(found)
+
+
+class _Source:
+    """Forward only reader over a file object, which can push back data read too far"""
+
+    def __init__(self, fileobj):
+        self._file = fileobj
+        self._pending = b""
+
+    def read(self, size: int) -> bytes:
+        """Up to size bytes - fewer only at the end of the data"""
+        if self._pending:
+            data, self._pending = self._pending[:size], self._pending[size:]
+            if len(data) == size:
+                return data
+            return data + self._file.read(size - len(data))
+        return self._file.read(size)
+
+    def read_exact(self, size: int) -> bytes:
+        data = self.read(size)
+        while len(data) < size:
+            more = self._file.read(size - len(data))
+            if not more:
+                raise zipfile.BadZipFile("Truncated zip file")
+            data += more
+        return data
+
+    def unread(self, data: bytes) -> None:
+        self._pending = data + self._pending
+
+
+class StreamedMember:
+    """One member of a zip archive being streamed
+
+    read() returns the uncompressed data and checks its CRC once the end is
+    reached.  The crc and size are final once the member has been read or
+    skipped - members written with a data descriptor only have them at the end.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self, source: _Source, name: str, flags: int, method: int, crc: int, compressed: int, size: int, zip64: bool
+    ):
+        self.name = name
+        self.crc = crc
+        self.size = size
+        self.method = method
+        self._source = source
+        self._flags = flags
+        # Zip64 members have 8 byte sizes in their data descriptor
+        self._zip64 = zip64
+        # Compressed bytes left to read, or None when the end is only found by decompressing
+        self._remaining: Optional[int] = None if flags & _FLAG_DESCRIPTOR else compressed
+        self._decompressor = zlib.decompressobj(-15) if method == zipfile.ZIP_DEFLATED else None
+        self._buffer = b""
+        self._crc = 0
+        self._read_size = 0
+        self._finished = False
+
+    def _fill(self) -> bool:
+        """Add the next chunk of uncompressed data to the buffer, False at the end of the member"""
+        if self._finished:
+            return False
+        if self.method not in STREAMED_METHODS:
+            raise zipfile.BadZipFile(f"Compression method {self.method} of {self.name} is not supported")
+        decompressor = self._decompressor
+        if decompressor is not None and decompressor.unconsumed_tail:
+            raw = decompressor.unconsumed_tail
+        elif self._remaining == 0:
+            raw = b""
+        else:
+            size = _CHUNK_SIZE if self._remaining is None else min(_CHUNK_SIZE, self._remaining)
+            raw = self._source.read(size)
+            if not raw:
+                raise zipfile.BadZipFile(f"Truncated zip member {self.name}")
+            if self._remaining is not None:
+                self._remaining -= len(raw)
+        if decompressor is None:
+            data = raw
+            end = self._remaining == 0
+        else:
+            # Output is capped at a chunk, the rest of the input is kept as the unconsumed tail
+            data = decompressor.decompress(raw, _CHUNK_SIZE)
+            end = decompressor.eof
+            if end and decompressor.unused_data:
+                # Read past the member into the next header
+                self._source.unread(decompressor.unused_data)
+            elif not data and not raw:
+                raise zipfile.BadZipFile(f"Truncated zip member {self.name}")
+        if data:
+            self._crc = zlib.crc32(data, self._crc)
+            self._read_size += len(data)
+            self._buffer += data
+        if end:
+            self._finish()
+        return True
+
+    def _finish(self) -> None:
+        self._finished = True
+        if self._flags & _FLAG_DESCRIPTOR:
+            signature = self._source.read_exact(4)
+            if signature != _DESCRIPTOR_SIGNATURE:
+                # The descriptor signature is optional
+                self._source.unread(signature)
+            if self._zip64:
+                self.crc, _, self.size = struct.unpack("<LQQ", self._source.read_exact(20))
+            else:
+                self.crc, _, self.size = struct.unpack("<LLL", self._source.read_exact(12))
+        if self._crc != self.crc or self._read_size != self.size:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for file {self.name}")
+
+    def read(self, size: int = -1) -> bytes:
+        """Up to size bytes of uncompressed data (all of the rest if size is negative), empty at the end"""
+        if size < 0:
+            chunks = [self._buffer]
+            self._buffer = b""
+            while self._fill():
+                chunks.append(self._buffer)
+                self._buffer = b""
+            return b"".join(chunks)
+        while len(self._buffer) < size and self._fill():
+            pass
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def skip(self) -> None:
+        """Move past the rest of the member"""
+        self._buffer = b""
+        if self._finished:
+            return
+        if self._remaining is not None and not (self._decompressor and self._decompressor.unconsumed_tail):
+            # The compressed size is known, so the data can be passed over without decompressing it
+            while self._remaining > 0:
+                raw = self._source.read(min(_CHUNK_SIZE, self._remaining))
+                if not raw:
+                    raise zipfile.BadZipFile(f"Truncated zip member {self.name}")
+                self._remaining -= len(raw)
+            self._finished = True
+            return
+        while self._fill():
+            self._buffer = b""
+
+
+def stream_zip(fileobj) -> Iterator[StreamedMember]:
+    """Members of a zip archive, read in order from a forward only file object
+
+    Each member has to be used before asking for the next one; whatever is
+    left of it is skipped.  The archive's central directory is never read.
+    """
+    source = _Source(fileobj)
+    while True:
+        header = source.read(_LOCAL_HEADER.size)
+        if len(header) < _LOCAL_HEADER.size or header[:4] != _LOCAL_SIGNATURE:
+            # The central directory, or the end of the data - there are no more members
+            return
+        _, _, flags, method, _, _, crc, compressed, size, name_length, extra_length = _LOCAL_HEADER.unpack(header)
+        raw_name = source.read_exact(name_length)
+        extra = source.read_exact(extra_length)
+        name = raw_name.decode("utf-8" if flags & _FLAG_UTF8 else "cp437")
+        if flags & _FLAG_ENCRYPTED:
+            raise zipfile.BadZipFile(f"{name} is encrypted")
+        if flags & _FLAG_DESCRIPTOR and method != zipfile.ZIP_DEFLATED:
+            # Without the compressed size there is no way to find the end of the member
+            raise zipfile.BadZipFile(f"{name} can't be streamed - its size is only given after its data")
+        zip64 = compressed == _ZIP64_LIMIT or size == _ZIP64_LIMIT
+        if zip64:
+            size, compressed = _zip64_sizes(extra, size, compressed)
+        member = StreamedMember(source, name, flags, method, crc, compressed, size, zip64)
+        yield member
+        member.skip()
+
+
+def _zip64_sizes(extra: bytes, size: int, compressed: int) -> Tuple[int, int]:
+    """Uncompressed and compressed sizes from the zip64 extra field of a local header"""
+    pos = 0
+    while pos + 4 <= len(extra):
+        tag, length = struct.unpack_from("<HH", extra, pos)
+        if tag == _ZIP64_EXTRA:
+            values = list(struct.unpack_from(f"<{length // 8}Q", extra, pos + 4))
+            if size == _ZIP64_LIMIT and values:
+                size = values.pop(0)
+            if compressed == _ZIP64_LIMIT and values:
+                compressed = values.pop(0)
+            break
+        pos += 4 + length
+    return size, compressed
+
+
+def nested_members(zip_path: str, archives: List[str]) -> Iterator[StreamedMember]:
+    """Members of a zip file nested inside the zip file at zip_path
+
+    archives names the zip members to open in turn, from the outer archive
+    in - ["bulk.zip"] streams the members of bulk.zip inside zip_path.
+    """
+    with zipfile.ZipFile(zip_path, "r") as zfile, zfile.open(archives[0]) as outer:
+        members = stream_zip(outer)
+        for archive in archives[1:]:
+            for member in members:
+                if member.name == archive:
+                    members = stream_zip(member)
+                    break
+            else:
+                raise FileNotFoundError(f"{archive} not found in {zip_path}")
+        yield from members
@@ -1,35 +1,113 @@
 # Test basic functions
-import customtkinter as ctk  # type: ignore
-import sdif_merge_ui as ui
-from version import APP_VERSION
-from config import appConfig
 import logging
 import os
 import sys
-import app_version
-from requests.exceptions import RequestException
+import time
+from contextlib import contextmanager
+from threading import Thread
+from typing import Iterator, List, Optional, Tuple
 
+# The user interface, the merge and the update check are imported in main(), so their start up cost can be timed
 
-def check_for_update() -> None:
-    """Notifies if there's a newer released version"""
-    current_version = APP_VERSION
-    try:
-        latest_version = app_version.latest()
-        if latest_version is not None and not app_version.is_latest_version(latest_version, current_version):
-            logging.info(f"New version available {latest_version.tag}")
-            logging.info(f"Download URL: {latest_version.url}")
-    #           Make it clickable???  webbrowser.open(latest_version.url))
-    except RequestException as ex:
-        logging.warning("Error checking for update: %s", ex)
+
+class StartupProfile:
+    """Time taken by each import and initialisation phase of the launch
+
+    Run with --profile-startup (or SDIF_MERGE_PROFILE_STARTUP=1) to log the
+    report in the message window once the window is first drawn.
+    """
+
+    def __init__(self):
+        self._started = time.perf_counter()
+        self.phases: List[Tuple[str, float, int]] = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time a phase, along with the number of modules it imports"""
+        modules = len(sys.modules)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started, len(sys.modules) - modules))
+
+    def report(self) -> List[str]:
+        """Report lines - one per phase, then the total since the profile was created"""
+        lines = ["Startup profile:"]
+        for name, seconds, modules in self.phases:
+            lines.append(f"  {name:<24}{seconds * 1000:>8.1f} ms{modules:>6} modules")
+        lines.append(f"  {'Total':<24}{(time.perf_counter() - self._started) * 1000:>8.1f} ms")
+        return lines
+
+    @staticmethod
+    def enabled() -> bool:
+        return "--profile-startup" in sys.argv[1:] or os.environ.get("SDIF_MERGE_PROFILE_STARTUP", "") not in ("", "0")
+
+
+class UpdateCheck(Thread):
+    """Looks for a newer released version in the background
+
+    The release list is cached in the configuration directory, so a request
+    is only made once the cached copy is older than update_check_ttl hours.
+    """
+
+    def __init__(self, cache_dir: str, ttl: float):
+        super().__init__(daemon=True)
+        self._cache_file = os.path.join(cache_dir, "releases.json")
+        self._ttl = ttl
+        self.latest_version = None
+        self.error: Optional[Exception] = None
+
+    def run(self):
+        # pylint: disable=import-outside-toplevel
+        import app_version
+        from requests.exceptions import RequestException
+        from version import APP_VERSION
+
+        try:
+            latest_version = app_version.latest(self._cache_file, self._ttl)
+            if latest_version is not None and not app_version.is_latest_version(latest_version, APP_VERSION):
+                self.latest_version = latest_version
+        except RequestException as ex:
+            self.error = ex
+
+
+def check_for_update(root, config) -> None:
+    """Starts the update check, notifying from the UI thread if there's a newer released version"""
+    thread = UpdateCheck(config.get_config_dir(), config.get_float("update_check_ttl") * 3600)
+    thread.start()
+    monitor_update_check(root, thread)
+
+
+def monitor_update_check(root, thread: UpdateCheck) -> None:
+    if thread.is_alive():
+        # check the thread every 100ms
+        root.after(100, lambda: monitor_update_check(root, thread))
+    elif thread.error is not None:
+        logging.warning("Error checking for update: %s", thread.error)
+    elif thread.latest_version is not None:
+        logging.info(f"New version available {thread.latest_version.tag}")
+        logging.info(f"Download URL: {thread.latest_version.url}")
+        #           Make it clickable???  webbrowser.open(latest_version.url))
 
 
 def main():
     """Runs the application"""
+    profile = StartupProfile()
+
+    # pylint: disable=import-outside-toplevel
+    with profile.phase("Import customtkinter"):
+        import customtkinter as ctk  # type: ignore
+    with profile.phase("Import user interface"):
+        import sdif_merge_ui as ui
+        from config import appConfig
 
     bundle_dir = getattr(sys, "_MEIPASS", os.path.abspath(os.path.dirname(__file__)))
 
-    root = ctk.CTk()
-    config = appConfig()
+    with profile.phase("Create window"):
+        root = ctk.CTk()
+    with profile.phase("Load settings"):
+        config = appConfig()
     ctk.set_appearance_mode(config.get_str("Theme"))  # Modes: "System" (standard), "Dark", "Light"
     ctk.set_default_color_theme(config.get_str("Colour"))  # Themes: "blue" (standard), "green", "dark-blue"
     new_scaling_float = int(config.get_str("Scaling").replace("%", "")) / 100
@@ -43,12 +121,13 @@ def main():
     root.columnconfigure(0, weight=1)
     root.rowconfigure(0, weight=1)
     root.resizable(True, True)
-    content = ui.mainApp(root, config)
-    content.grid(column=0, row=0, sticky="news")
-    check_for_update()
+    with profile.phase("Build user interface"):
+        content = ui.mainApp(root, config)
+        content.grid(column=0, row=0, sticky="news")
 
     try:
-        root.update()
+        with profile.phase("First paint"):
+            root.update()
         # pylint: disable=import-error,import-outside-toplevel
         import pyi_splash  # type: ignore
 
@@ -59,6 +138,14 @@ def main():
     except RuntimeError:
         pass
 
+    # Only started once the window is drawn, so it never delays the first paint
+    with profile.phase("Start update check"):
+        check_for_update(root, config)
+
+    if StartupProfile.enabled():
+        for line in profile.report():
+            logging.info(line)
+
     root.mainloop()
 
     config.save()
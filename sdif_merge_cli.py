@@ -0,0 +1,155 @@
+"""Command line (headless) SDIF merge
+
+Runs the same merge as the "Merge SDIF Files" button without starting the
+user interface, for use from scripts and scheduled tasks:
+
+    python -m sdif_merge_cli ENTRY_DIRECTORY -o merged.sd3 -r report.txt
+
+With --watch it keeps running and re-merges whenever entry files arrive or
+change, until interrupted with Ctrl-C.
+Options that are not given on the command line are taken from the saved
+program settings.  The settings file is never updated by a command line run.
+Exits with a non-zero status if the merge fails.
+"""
+
+import argparse
+import logging
+import os
+import sys
+from typing import List, Optional
+
+# Appliction Specific Imports - must not pull in tkinter or customtkinter
+from config import appConfig
+from sdif_merge_core import SDIF_Merge, SDIF_Watch
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse the command line"""
+    parser = argparse.ArgumentParser(prog="sdif_merge_cli", description="Merge SDIF (SD3) entry files")
+    parser.add_argument("directory", help="Entry file directory containing .sd3 and .zip files")
+    parser.add_argument("-o", "--output", help="Output SD3 file")
+    parser.add_argument("-r", "--report", help="Output report file")
+    parser.add_argument("--club-csv", help="Local club CSV file (default: online club list)")
+    parser.add_argument(
+        "--country", action=argparse.BooleanOptionalAction, default=None, help="Update the C1 country code"
+    )
+    parser.add_argument(
+        "--region", action=argparse.BooleanOptionalAction, default=None, help="Update the C1 region code"
+    )
+    parser.add_argument(
+        "--group-by-club",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Write clubs in club code order with each club's entries together",
+    )
+    parser.add_argument(
+        "--split-by-meet",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Merge the entries of each meet (B1 record) to its own output and report file",
+    )
+    parser.add_argument(
+        "--include-subfolders",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Also merge the entry files in subfolders of the entry file directory",
+    )
+    parser.add_argument(
+        "--zip-output",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Write the merged SD3 file and the report into a zip file named after the output file",
+    )
+    parser.add_argument(
+        "--zip-level", type=int, choices=range(0, 10), metavar="0-9", help="Deflate level of the zipped output"
+    )
+    parser.add_argument(
+        "--dedup-policy",
+        choices=["off", "first", "newest", "fastest"],
+        help="Merge duplicate clubs, entries and relays, keeping the first, newest or fastest copy",
+    )
+    parser.add_argument(
+        "--validation",
+        choices=["off", "report", "pad", "drop"],
+        help="Check records before merging: report bad records, pad records of the wrong length, or drop bad records",
+    )
+    parser.add_argument(
+        "--stats-json",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Also write the merge statistics to a JSON file named after the report",
+    )
+    parser.add_argument(
+        "--trace-memory", action="store_true", help="Trace Python allocations for the peak memory statistics"
+    )
+    parser.add_argument(
+        "--watch", action="store_true", help="Keep running and re-merge whenever the entry files change"
+    )
+    parser.add_argument("-q", "--quiet", action="store_true", help="Only log warnings and errors")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Runs a single merge, returning the process exit code"""
+    args = parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO, format="%(levelname)s - %(message)s")
+
+    if not os.path.isdir(args.directory):
+        logging.error("Entry file directory not found: %s", args.directory)
+        return 2
+
+    config = appConfig()
+    config.set_str("entry_file_directory", args.directory)
+    if args.output is not None:
+        config.set_str("output_sd3_file", args.output)
+    if args.report is not None:
+        config.set_str("output_report_file", args.report)
+    if args.club_csv is not None:
+        config.set_str("csv_file", args.club_csv)
+    if args.country is not None:
+        config.set_bool("set_country", args.country)
+    if args.region is not None:
+        config.set_bool("set_region", args.region)
+    if args.group_by_club is not None:
+        config.set_bool("group_by_club", args.group_by_club)
+    if args.split_by_meet is not None:
+        config.set_bool("split_by_meet", args.split_by_meet)
+    if args.include_subfolders is not None:
+        config.set_bool("include_subfolders", args.include_subfolders)
+    if args.zip_output is not None:
+        config.set_bool("zip_output", args.zip_output)
+    if args.zip_level is not None:
+        config.set_int("zip_level", args.zip_level)
+    if args.dedup_policy is not None:
+        config.set_str("dedup_policy", args.dedup_policy)
+    if args.validation is not None:
+        config.set_str("validation", args.validation)
+    if args.stats_json is not None:
+        config.set_bool("stats_json", args.stats_json)
+    if args.trace_memory:
+        config.set_bool("trace_memory", True)
+
+    if args.watch:
+        watch = SDIF_Watch(config)
+        watch.start()
+        try:
+            while watch.is_alive():
+                watch.join(0.5)
+        except KeyboardInterrupt:
+            watch.stop()
+            watch.join()
+        return 0
+
+    merge = SDIF_Merge(config)
+    try:
+        merge.run()
+    except Exception:  # pylint: disable=broad-except
+        logging.exception("Merge failed")
+        return 1
+
+    return 0 if merge.success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,1492 @@
 """Update functions for Splash Utilities"""
 
 from config import appConfig
-from threading import Thread
+from sdif_inputs import (
+    SD3_NAME,
+    STREAMED_METHODS,
+    ZIP_NAME,
+    StreamedMember,
+    find_input_files,
+    nested_members,
+    stream_zip,
+)
+from sdif_records import FIELDS, decode_time, field_slice
+from sdif_validation import RecordIssue, RecordValidator
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import closing, contextmanager, suppress
+from threading import Event, Lock, Thread, get_ident
 from version import CLUB_CSV_URL
 
-# import requests
 import csv
+import hashlib
+import heapq
+import io
+import json
 import logging
+import mmap
 import os
+import pathlib
 import zipfile
-import io
+import zlib
 import re
-import requests
+import shutil
+import struct
+import tempfile
 import datetime
+import functools
+import pickle
+import sys
+import time
+import tracemalloc
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple, Union
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows - peak memory is only reported when tracing allocations
+    resource = None
+
+
+# SDIF records are fixed width
+SDIF_RECORD_LENGTH = 160
+SDIF_LINE_END = b"\r\n"
+
+# Record data handled by the merge - bytes, or zero-copy slices of an input
+Buffer = Union[bytes, bytearray, memoryview]
+
+# First characters of lines that are not records - blank lines and the DOS end of file mark - left out of the merge
+_NOT_RECORD = b"\r\n\x1a"
+
+# Input bytes between progress updates and cancel checks while records are split
+_PROGRESS_BYTES = 256 * 1024
+
+# Errors from an input that can't be read, such as a zip file that is still being copied in
+_UNREADABLE_INPUT = (zipfile.BadZipFile, zlib.error, EOFError, OSError)
+
+
+def _span(record_type: bytes, first: str, last: str) -> slice:
+    """Slice from the start of the first field to the end of the last"""
+    fields = FIELDS[record_type]
+    return slice(fields[first].start, fields[last].end)
+
+
+# Fields of the raw records used by the merge (see sdif_records for the layouts)
+_B1_MEET_NAME = field_slice(b"B1", "meet_name")
+_B1_START_DATE = field_slice(b"B1", "start_date")
+_C1_LSC = field_slice(b"C1", "lsc")
+_C1_TEAM = field_slice(b"C1", "team")
+_C1_TEAM_CODE_5 = field_slice(b"C1", "team_code_5")
+_C1_NAME = field_slice(b"C1", "name")
+_C1_COUNTRY = field_slice(b"C1", "country")
+_D0_NAME = field_slice(b"D0", "name")
+_D0_USS_NUMBER = field_slice(b"D0", "uss_number")
+_D0_EVENT = _span(b"D0", "sex", "stroke")
+_D0_EVENT_AGE = field_slice(b"D0", "event_age")
+_D0_SEED_TIME = field_slice(b"D0", "seed_time")
+_E0_TEAM = _span(b"E0", "relay_team_name", "team_code")
+_E0_EVENT = _span(b"E0", "event_sex", "stroke")
+_E0_EVENT_AGE = field_slice(b"E0", "event_age")
+_E0_SEED_TIME = field_slice(b"E0", "seed_time")
+
+
+class ClubRegistry:
+    """Club master list indexed by club code
+
+    Built once per merge from the club CSV file.  Club codes that appear more
+    than once are flagged when the registry is built and are never matched,
+    the same as the previous behaviour of skipping ambiguous clubs.  Rows are
+    kept as plain value lists, read by the column indexes of the header, to
+    keep the national club list small.
+    """
+
+    __slots__ = ("_code_index", "_province_index", "_clubs", "_duplicates")
+
+    def __init__(self):
+        self._code_index = -1
+        self._province_index = -1
+        self._clubs: Dict[str, List[str]] = {}
+        self._duplicates: Set[str] = set()
+
+    @classmethod
+    def from_csv(cls, lines: Iterable[str]) -> "ClubRegistry":
+        """Build the registry straight from CSV text lines, one row at a time"""
+        registry = cls()
+        reader = csv.reader(lines)
+        header = next(reader, None)
+        if header is None:
+            return registry
+        registry._set_fields(header)
+        if registry._code_index < 0 or registry._province_index < 0:
+            logging.error("Club CSV file is missing the Club Code or Province column")
+            return cls()
+        width = max(registry._code_index, registry._province_index)
+        for values in reader:
+            if len(values) > width:
+                registry.add(values)
+        return registry
+
+    def _set_fields(self, fields: List[str]) -> None:
+        fields = [field.strip() for field in fields]
+        self._code_index = fields.index("Club Code") if "Club Code" in fields else -1
+        self._province_index = fields.index("Province") if "Province" in fields else -1
+
+    def add(self, values: List[str]) -> None:
+        """Add a club row, flagging the code if it is already present"""
+        if self._code_index < 0:
+            raise ValueError("Club list has no Club Code column")
+        code = values[self._code_index]
+        if code in self._duplicates:
+            return
+        if code in self._clubs:
+            del self._clubs[code]
+            self._duplicates.add(code)
+            logging.warning("Duplicate club code in club list: %s - club will not be updated", code)
+            return
+        self._clubs[code] = values
+
+    def province(self, code: str) -> Optional[str]:
+        """Return the province of a club, or None if unknown or duplicated"""
+        values = self._clubs.get(code)
+        if values is None:
+            return None
+        return values[self._province_index]
+
+    def fingerprint(self) -> bytes:
+        """Digest of the club codes and provinces, used to invalidate cached merge results"""
+        digest = hashlib.sha256()
+        for code in sorted(self._clubs):
+            digest.update(f"{code}\t{self._clubs[code][self._province_index]}\n".encode("utf-8"))
+        for code in sorted(self._duplicates):
+            digest.update(f"{code}\t*\n".encode("utf-8"))
+        return digest.digest()
+
+    @property
+    def duplicates(self) -> Set[str]:
+        """Club codes that appear more than once in the club list"""
+        return self._duplicates
+
+    def __len__(self) -> int:
+        return len(self._clubs) + len(self._duplicates)
+
+    def __contains__(self, code: str) -> bool:
+        return code in self._clubs
+
+
+class ClubDataSource:
+    """Where the club master list comes from"""
+
+    def load(self) -> ClubRegistry:
+        """Load and index the club list"""
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        """Human readable description for the log and report"""
+        raise NotImplementedError
+
+
+class LocalClubSource(ClubDataSource):
+    """Club list read from a CSV file on disk"""
+
+    def __init__(self, path: str):
+        self._path = path
+
+    def load(self) -> ClubRegistry:
+        try:
+            with open(self._path, "r", newline="", encoding="utf-8-sig", errors="replace") as file:
+                return ClubRegistry.from_csv(file)
+        except OSError as e:
+            logging.error("Unable to read club CSV file: %s", self._path)
+            logging.error(e)
+            return ClubRegistry()
+
+    def describe(self) -> str:
+        return f"Club CSV File: {self._path}"
+
+
+class RemoteClubSource(ClubDataSource):
+    """Club list downloaded on every load"""
+
+    def __init__(self, url: str, timeout: float):
+        self._url = url
+        self._timeout = timeout
+
+    def load(self) -> ClubRegistry:
+        # Imported here so requests is only loaded when the club list is downloaded
+        import requests  # pylint: disable=import-outside-toplevel
+
+        try:
+            with requests.get(self._url, timeout=self._timeout, stream=True) as response:
+                response.raise_for_status()
+                return ClubRegistry.from_csv(_response_lines(response))
+        except (requests.exceptions.RequestException, csv.Error) as e:
+            logging.error("Error downloading CSV file")
+            logging.error(e)
+            return ClubRegistry()
+
+    def describe(self) -> str:
+        return "Club CSV File: online club list"
+
+
+class CachedClubSource(ClubDataSource):
+    """Club list downloaded through the on-disk cache"""
+
+    def __init__(self, url: str, cache: "ClubCSVCache"):
+        self._url = url
+        self._cache = cache
+
+    def load(self) -> ClubRegistry:
+        return self._cache.load(self._url)
+
+    def describe(self) -> str:
+        return "Club CSV File: online club list (cached)"
+
+
+def _response_lines(response) -> Iterator[str]:
+    """Decoded text lines of a streamed download"""
+    if response.encoding is None:
+        response.encoding = "utf-8"
+    for line in response.iter_lines(decode_unicode=True):
+        yield line
+
+
+class ClubCSVCache:
+    """Persistent cache of the club master list
+
+    The parsed club list is kept as a pickled snapshot in the configuration
+    directory together with the ETag/Last-Modified headers of the download.
+    Within the TTL the snapshot is used as-is; after that the server is asked
+    with a conditional request and the snapshot is reused on 304 Not Modified.
+    If the download fails, or gives no clubs, the last good snapshot is used.
+    """
+
+    _CACHE_FILE = "club_list.cache"
+    _SNAPSHOT_VERSION = 2
+
+    def __init__(self, cache_dir: str, ttl: float, timeout: float):
+        self._cache_file = os.path.join(cache_dir, self._CACHE_FILE)
+        self._ttl = ttl
+        self._timeout = timeout
+
+    def load(self, url: str) -> ClubRegistry:
+        """Return the club list for url, downloading it only when needed"""
+        snapshot = self._read_snapshot(url)
+        if snapshot is not None and time.time() - snapshot["fetched"] < self._ttl:
+            logging.info("Using cached club list")
+            return snapshot["clubs"]
+
+        headers = {}
+        if snapshot is not None:
+            if snapshot["etag"]:
+                headers["If-None-Match"] = snapshot["etag"]
+            if snapshot["last_modified"]:
+                headers["If-Modified-Since"] = snapshot["last_modified"]
+
+        # Imported here so requests is only loaded when the club list is downloaded
+        import requests  # pylint: disable=import-outside-toplevel
+
+        not_modified = False
+        clubs = ClubRegistry()
+        try:
+            with requests.get(url, headers=headers, timeout=self._timeout, stream=True) as response:
+                response.raise_for_status()
+                not_modified = response.status_code == 304 and snapshot is not None
+                if not not_modified:
+                    try:
+                        clubs = ClubRegistry.from_csv(_response_lines(response))
+                    except csv.Error as e:
+                        # Not a club list - handled below the same as a download without clubs
+                        logging.warning("Unable to read the downloaded club list: %s", e)
+        except requests.exceptions.RequestException as e:
+            if snapshot is None:
+                logging.error("Error downloading CSV file")
+                logging.error(e)
+                return ClubRegistry()
+            fetched = datetime.datetime.fromtimestamp(snapshot["fetched"])
+            logging.warning(
+                "Error downloading CSV file - using club list cached %s", fetched.strftime("%Y-%m-%d %H:%M")
+            )
+            logging.warning(e)
+            return snapshot["clubs"]
+
+        if not_modified:
+            logging.info("Club list not modified - using cached copy")
+            snapshot["fetched"] = time.time()
+            self._write_snapshot(snapshot)
+            return snapshot["clubs"]
+
+        if len(clubs) == 0 and snapshot is not None:
+            # Not a club list (e.g. a captive portal page) - treated like a failed download
+            fetched = datetime.datetime.fromtimestamp(snapshot["fetched"])
+            logging.warning(
+                "Downloaded club list is empty or unreadable - using club list cached %s",
+                fetched.strftime("%Y-%m-%d %H:%M"),
+            )
+            return snapshot["clubs"]
+
+        if len(clubs) > 0:
+            self._write_snapshot(
+                {
+                    "version": self._SNAPSHOT_VERSION,
+                    "url": url,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "fetched": time.time(),
+                    "clubs": clubs,
+                }
+            )
+        return clubs
+
+    def _read_snapshot(self, url: str) -> Optional[dict]:
+        try:
+            with open(self._cache_file, "rb") as file:
+                snapshot = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception as e:  # pylint: disable=broad-except
+            logging.warning("Ignoring unreadable club list cache: %s", e)
+            return None
+        if not isinstance(snapshot, dict) or snapshot.get("version") != self._SNAPSHOT_VERSION:
+            return None
+        if snapshot.get("url") != url:
+            return None
+        return snapshot
+
+    def _write_snapshot(self, snapshot: dict) -> None:
+        temp_file = self._cache_file + ".tmp"
+        try:
+            with open(temp_file, "wb") as file:
+                pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_file, self._cache_file)
+        except OSError as e:
+            logging.warning("Unable to save club list cache: %s", e)
+
+
+def _meet_key(head: bytes) -> bytes:
+    """Meet name and start date from the B1 record at the start of an SD3 stream, or empty if it has none"""
+    for line in head.splitlines():
+        if line.startswith(b"B1"):
+            return line[_B1_MEET_NAME].strip() + b"\0" + line[_B1_START_DATE].strip()
+    return b""
+
+
+def _find_member(members: Iterator[StreamedMember], name: str) -> StreamedMember:
+    """Skip ahead in a streamed zip file to the member called name"""
+    for member in members:
+        if member.name == name:
+            return member
+    raise FileNotFoundError(f"{name} not found in nested zip file")
+
+
+class _MergeInput:
+    """One SD3 stream to merge: a plain .sd3 file or an .sd3 member of a zip file
+
+    Members of zip files nested in a zip file are listed with the names of
+    the nested zip files leading to them in archives.  Their data is streamed
+    and attached as data just before they are merged.
+    """
+
+    __slots__ = ("file_name", "member_name", "member_crc", "size", "archives", "meet", "data")
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        file_name: str,
+        member_name: Optional[str] = None,
+        member_crc: Optional[int] = None,
+        size: int = 0,
+        archives: Tuple[str, ...] = (),
+        meet: Optional[bytes] = None,
+    ):
+        self.file_name = file_name
+        self.member_name = member_name
+        self.member_crc = member_crc
+        # Uncompressed size of the SD3 stream, for progress
+        self.size = size
+        self.archives = archives
+        # Meet key, when it was read while the input was listed
+        self.meet = meet
+        self.data: Optional[bytes] = None
+
+    @property
+    def label(self) -> str:
+        if self.member_name is None:
+            return self.file_name
+        return f"{self.member_name} in zip file: {'/'.join((self.file_name,) + self.archives)}"
+
+    def meet_key(self, directory: str) -> bytes:
+        """Meet name and start date from the input's B1 record, or empty if it has none"""
+        if self.meet is not None:
+            return self.meet
+        path = os.path.join(directory, self.file_name)
+        if self.member_name is None:
+            with open(path, "rb") as file:
+                head = file.read(4096)
+        else:
+            with zipfile.ZipFile(path, "r") as zfile, zfile.open(self.member_name) as member:
+                head = member.read(4096)
+        return _meet_key(head)
+
+    def read(self, directory: str) -> Union[bytes, mmap.mmap]:
+        """Source - a read-only memory map of a plain .sd3 file, or the bytes of a zip member"""
+        path = os.path.join(directory, self.file_name)
+        if self.archives:
+            data, self.data = self.data, None
+            if data is None:
+                # Not streamed in merge order - find it from the start of its nested zip file
+                with closing(nested_members(path, list(self.archives))) as members:
+                    data = _find_member(members, self.member_name).read()
+            return data
+        if self.member_name is None:
+            with open(path, "rb") as file:
+                try:
+                    return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    # Empty files can't be mapped
+                    return b""
+        with zipfile.ZipFile(path, "r") as zfile:
+            return zfile.read(self.member_name)
+
+
+class _MergedInput:
+    """Records of one input, ready to be written to the merged file
+
+    Records are kept as bytes.  Runs of records that are copied unchanged are
+    held as memoryview slices of the input data, which for plain .sd3 files is
+    a memory map; only patched records are copies.  close() must be called
+    once the segments have been written.
+    """
+
+    __slots__ = (
+        "item",
+        "a0",
+        "b1",
+        "z0",
+        "segments",
+        "length",
+        "groups",
+        "source",
+        "repaired",
+        "cached",
+        "counts",
+        "seconds",
+        "swimmers",
+        "issues",
+    )
+
+    def __init__(self, item: _MergeInput):
+        self.item = item
+        self.cached = False
+        self.counts: Dict[bytes, int] = {}
+        # Time spent splitting the records of each type
+        self.seconds: Dict[bytes, float] = {}
+        self.swimmers: Set[bytes] = set()
+        self.length = 0
+        # Duplicate detection groups - byte offset, record type, fingerprint and seed time
+        self.groups: List[Tuple[int, bytes, int, int]] = []
+        self.a0: Optional[bytes] = None
+        self.b1: Optional[bytes] = None
+        self.z0: Optional[bytes] = None
+        self.segments: List[Buffer] = []
+        self.source: Union[bytes, mmap.mmap] = b""
+        # True when source is a repaired copy of the input rather than the input itself
+        self.repaired = False
+        # Records that failed validation
+        self.issues: List[RecordIssue] = []
+
+    def close(self) -> None:
+        """Release the slices of the input and unmap it"""
+        for segment in self.segments:
+            if isinstance(segment, memoryview):
+                segment.release()
+        self.segments = []
+        if isinstance(self.source, mmap.mmap):
+            try:
+                self.source.close()
+            except BufferError:
+                # Slices are still referenced elsewhere - the map is released along with the last of them
+                pass
+
+    def add(self, segment: Buffer) -> None:
+        """Append records to be written"""
+        self.segments.append(segment)
+        self.length += len(segment)
+
+    # Record handlers used by the record type dispatch table
+
+    def keep_a0(self, record: memoryview) -> None:
+        if self.a0 is None:
+            self.a0 = bytes(record)
+
+    def keep_b1(self, record: memoryview) -> None:
+        if self.b1 is None:
+            self.b1 = bytes(record)
+
+    def keep_z0(self, record: memoryview) -> None:
+        self.z0 = bytes(record)
+
+
+class _RecordHandlers(NamedTuple):
+    """Record type dispatch tables, built once per merge - unlisted types are copied as-is
+
+    A record of a type in rewrite is cut out of the run of unchanged records
+    and passed to its handler, which adds it, changed or not.  A record of a
+    type in observe is only read: its handler gets the record and its offset
+    in the input's output, and the record stays in the unchanged run.
+    """
+
+    rewrite: Dict[bytes, Callable[[_MergedInput, memoryview], None]]
+    observe: Dict[bytes, Callable[[_MergedInput, int, bytes], None]]
+
+
+class _RecordCounter:
+    """Streaming tally of the records written to the merged file
+
+    Counts are gathered per input while it is read, added here as each input
+    is written and used to build a Z0 trailer that describes the merged file.
+    """
+
+    # Z0 count fields and the record types they count
+    _Z0_FIELDS = tuple(
+        (FIELDS[b"Z0"][name], record_type)
+        for name, record_type in (
+            ("b_records", b"B"),
+            ("meets", b"B1"),
+            ("c_records", b"C"),
+            ("teams", b"C1"),
+            ("d_records", b"D"),
+            ("swimmers", None),
+            ("e_records", b"E"),
+            ("f_records", b"F"),
+            ("g_records", b"G"),
+        )
+    )
+
+    def __init__(self):
+        self.counts: Dict[bytes, int] = {}
+        self.swimmers: Set[bytes] = set()
+        # Records read and the time taken to split them by type, for the throughput of each type
+        self.read: Dict[bytes, int] = {}
+        self.seconds: Dict[bytes, float] = {}
+
+    def add(self, record_type: bytes, count: int = 1) -> None:
+        self.counts[record_type] = self.counts.get(record_type, 0) + count
+
+    def add_input(self, merged: "_MergedInput") -> None:
+        """Add the records of an input, leaving out its A0, B1 and Z0 which are not written"""
+        for record_type, count in merged.counts.items():
+            if record_type not in (b"A0", b"B1", b"Z0"):
+                self.add(record_type, count)
+            self.read[record_type] = self.read.get(record_type, 0) + count
+        for record_type, seconds in merged.seconds.items():
+            self.seconds[record_type] = self.seconds.get(record_type, 0.0) + seconds
+        self.swimmers.update(merged.swimmers)
+
+    def rate(self, record_type: bytes) -> float:
+        """Records of a type split per second"""
+        seconds = self.seconds.get(record_type, 0.0)
+        return self.read.get(record_type, 0) / seconds if seconds > 0 else 0.0
+
+    def total(self, prefix: bytes) -> int:
+        """Number of records whose type starts with prefix"""
+        return sum(count for record_type, count in self.counts.items() if record_type.startswith(prefix))
+
+    def z0_record(self, template: Optional[bytes]) -> bytes:
+        """Z0 trailer for the merged file, keeping the other fields of template"""
+        body, line_end = _split_record(template) if template is not None else (b"Z01", SDIF_LINE_END)
+        record = bytearray(body.ljust(SDIF_RECORD_LENGTH))
+        for field, record_type in self._Z0_FIELDS:
+            width = field.end - field.start
+            value = len(self.swimmers) if record_type is None else self.total(record_type)
+            record[field.start : field.end] = str(min(value, 10**width - 1)).rjust(width).encode("ascii")
+        return bytes(record) + (line_end or SDIF_LINE_END)
+
+
+def _peak_memory() -> Optional[int]:
+    """Peak memory of the process so far in bytes - traced allocations if tracemalloc is running, else the peak RSS"""
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[1]
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _StageStats:
+    """Totals of one merge stage"""
+
+    __slots__ = ("seconds", "bytes", "records", "peak")
+
+    def __init__(self, seconds: float = 0.0, bytes: int = 0, records: int = 0, peak: Optional[int] = None):
+        self.seconds = seconds
+        self.bytes = bytes
+        self.records = records
+        self.peak = peak
+
+    def add(self, other: "_StageStats") -> None:
+        self.seconds += other.seconds
+        self.bytes += other.bytes
+        self.records += other.records
+        if other.peak is not None:
+            self.peak = max(self.peak or 0, other.peak)
+
+    def as_dict(self) -> dict:
+        return {
+            "seconds": round(self.seconds, 6),
+            "bytes": self.bytes,
+            "records": self.records,
+            "records_per_second": round(self.records / self.seconds) if self.seconds > 0 else None,
+            "peak_memory": self.peak,
+        }
+
+
+class MergeStats:
+    """Wall time, bytes, records and peak memory of the merge stages, in total and per input
+
+    Stages that run on the worker pool add up the time of every worker, so
+    they can add up to more than the elapsed time.  Peak memory is the high
+    water mark of the process when the stage finished.
+    """
+
+    def __init__(self, base: Optional["MergeStats"] = None):
+        self._lock = Lock()
+        self.stages: Dict[str, _StageStats] = {}
+        self.inputs: Dict[str, Dict[str, _StageStats]] = {}
+        if base is not None:
+            for stage, totals in base.stages.items():
+                self.add(stage, totals)
+
+    @contextmanager
+    def measure(self, stage: str, input_label: Optional[str] = None) -> Iterator[_StageStats]:
+        """Time a stage - set bytes and records on the yielded totals"""
+        sample = _StageStats()
+        started = time.perf_counter()
+        try:
+            yield sample
+        finally:
+            sample.seconds = time.perf_counter() - started
+            sample.peak = _peak_memory()
+            self.add(stage, sample, input_label)
+
+    def add(self, stage: str, sample: _StageStats, input_label: Optional[str] = None) -> None:
+        with self._lock:
+            self.stages.setdefault(stage, _StageStats()).add(sample)
+            if input_label is not None:
+                self.inputs.setdefault(input_label, {}).setdefault(stage, _StageStats()).add(sample)
+
+    def write_report(self, report_file) -> None:
+        report_file.write("\nMerge Stages (worker stages are summed over all workers):\n\n")
+        report_file.write(
+            f"{'Stage':<16}{'Seconds':>9}{'MiB':>10}{'Records':>10}{'Records/sec':>14}{'Peak MiB':>10}\n"
+        )
+        for stage, totals in self.stages.items():
+            report_file.write(f"{stage:<16}{self._columns(totals)}\n")
+        report_file.write("\nPer Input:\n\n")
+        for input_label, stages in self.inputs.items():
+            report_file.write(f"{input_label}\n")
+            for stage, totals in stages.items():
+                report_file.write(f"  {stage:<14}{self._columns(totals)}\n")
+
+    @staticmethod
+    def _columns(totals: _StageStats) -> str:
+        rate = f"{totals.records / totals.seconds:,.0f}" if totals.seconds > 0 and totals.records else ""
+        peak = f"{totals.peak / 1048576:.1f}" if totals.peak is not None else ""
+        return f"{totals.seconds:>9.3f}{totals.bytes / 1048576:>10.2f}{totals.records:>10}{rate:>14}{peak:>10}"
+
+    def write_json(self, path: str, **info) -> None:
+        """Machine readable copy of the statistics, with extra top level information"""
+        document = dict(info)
+        document["stages"] = {stage: totals.as_dict() for stage, totals in self.stages.items()}
+        document["inputs"] = {
+            input_label: {stage: totals.as_dict() for stage, totals in stages.items()}
+            for input_label, stages in self.inputs.items()
+        }
+        with _AtomicFile(path, "w") as file:
+            json.dump(document, file, indent=2)
+
+
+class MergeCancelled(Exception):
+    """Raised inside a merge once it has been cancelled"""
+
+
+class MergeProgress(NamedTuple):
+    """Progress of a running merge"""
+
+    files_done: int
+    files_total: int
+    bytes_done: int
+    bytes_total: int
+    elapsed: float
+
+    @property
+    def fraction(self) -> float:
+        """Share of the input bytes processed, from 0 to 1"""
+        if self.bytes_total <= 0:
+            return 0.0
+        return min(self.bytes_done / self.bytes_total, 1.0)
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Estimated seconds left at the rate so far, or None until there is a rate"""
+        fraction = self.fraction
+        if fraction <= 0.0:
+            return None
+        return self.elapsed * (1.0 - fraction) / fraction
+
+
+class _ProgressTracker:
+    """Progress counters updated by the merge thread and its workers"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._started = time.perf_counter()
+        self._files_done = 0
+        self._files_total = 0
+        self._bytes_done = 0
+        self._bytes_total = 0
+
+    def add_total(self, files: int, size: int) -> None:
+        with self._lock:
+            self._files_total += files
+            self._bytes_total += size
+
+    def add_bytes(self, size: int) -> None:
+        with self._lock:
+            self._bytes_done += size
+
+    def file_done(self) -> None:
+        with self._lock:
+            self._files_done += 1
+
+    def snapshot(self) -> MergeProgress:
+        with self._lock:
+            return MergeProgress(
+                self._files_done,
+                self._files_total,
+                min(self._bytes_done, self._bytes_total),
+                self._bytes_total,
+                time.perf_counter() - self._started,
+            )
+
+
+class _AtomicFile:
+    """Output file that is written under a temporary name and swapped into place
+
+    The temporary file is in the same directory as the target, with a large
+    write buffer so a network share sees few large writes.  When the with
+    block completes the file is flushed to disk and atomically renamed over
+    the target; if the block fails or is cancelled it is deleted, so the
+    target is never left half written.
+    """
+
+    _BUFFER_SIZE = 1 << 20
+
+    def __init__(self, path: str, mode: str = "wb"):
+        self.path = path
+        self._partial_path = path + ".part"
+        self.file = open(self._partial_path, mode, buffering=self._BUFFER_SIZE)
+
+    def __enter__(self):
+        return self.file
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            try:
+                self.finish()
+                self.replace()
+            except BaseException:
+                self.discard()
+                raise
+        else:
+            self.discard()
+
+    def finish(self) -> None:
+        """Flush the temporary file to disk and close it"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+    def replace(self) -> None:
+        """Rename the finished temporary file over the target"""
+        os.replace(self._partial_path, self.path)
+
+    def discard(self) -> None:
+        self.file.close()
+        with suppress(OSError):
+            os.remove(self._partial_path)
+
+
+class _AtomicFiles:
+    """Output files that replace their targets together, such as a merged file and its report
+
+    Nothing is replaced until every file is flushed to disk.  The files are
+    then renamed over their targets in the order they were opened, keeping
+    a copy of each previous target but the last.  If a rename fails, say
+    because the target is open in another program on Windows, the targets
+    already replaced are put back, so the previous files stay together.
+    """
+
+    def __init__(self):
+        self._files: List[_AtomicFile] = []
+
+    def open(self, path: str, mode: str = "wb") -> _AtomicFile:
+        atomic = _AtomicFile(path, mode)
+        self._files.append(atomic)
+        return atomic
+
+    def __enter__(self) -> "_AtomicFiles":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            try:
+                for atomic in self._files:
+                    atomic.finish()
+                self._replace()
+            except BaseException:
+                self._discard()
+                raise
+        else:
+            self._discard()
+
+    def _replace(self) -> None:
+        # Targets replaced so far, each with the copy of its previous contents (None if it didn't exist)
+        replaced: List[Tuple[str, Optional[str]]] = []
+        backup = None
+        try:
+            for i, atomic in enumerate(self._files):
+                backup = None
+                if i < len(self._files) - 1 and os.path.exists(atomic.path):
+                    backup = atomic.path + ".prev"
+                    _copy_file(atomic.path, backup)
+                atomic.replace()
+                replaced.append((atomic.path, backup))
+        except OSError:
+            if backup is not None:
+                with suppress(OSError):
+                    os.remove(backup)
+            for path, previous in reversed(replaced):
+                with suppress(OSError):
+                    if previous is None:
+                        os.remove(path)
+                    else:
+                        os.replace(previous, path)
+            raise
+        for _, previous in replaced:
+            if previous is not None:
+                with suppress(OSError):
+                    os.remove(previous)
+
+    def _discard(self) -> None:
+        for atomic in self._files:
+            atomic.discard()
+
+
+def _copy_file(source: str, target: str) -> None:
+    """Copy a file, as a hard link where the file system allows it"""
+    with suppress(FileNotFoundError):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+class _ZipOutput:
+    """Merged SD3 file and report written into a zip file
+
+    The records are deflated as they are written to the zip member, so no
+    uncompressed copy of the merged file is ever written.  The report is
+    added as a second member once the records are complete.  When not
+    enabled, records is the output file itself and nothing is added.
+    """
+
+    def __init__(self, file: BinaryIO, member_name: str, level: int, enabled: bool = True):
+        self._zip: Optional[zipfile.ZipFile] = None
+        self.records: BinaryIO = file
+        if enabled:
+            self._zip = zipfile.ZipFile(file, "w", zipfile.ZIP_DEFLATED, compresslevel=level)
+            self.records = self._zip.open(member_name, "w")
+
+    def __enter__(self) -> "_ZipOutput":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self._zip is not None:
+            # The merge failed - the zip file is only closed here so it is not written when it is garbage collected
+            with suppress(Exception):
+                self.records.close()
+                self._zip.close()
+
+    def close(self, report_name: str, report: str) -> None:
+        """Finish the records and add the report"""
+        if self._zip is not None:
+            self.records.close()
+            self._zip.writestr(report_name, report)
+            self._zip.close()
+            self._zip = None
+
+
+class _BatchWriter:
+    """Collects output records and writes them in large batches
+
+    Small records are joined into one write.  Large segments, such as long
+    unchanged runs of a memory mapped input, are written straight from their
+    buffer without being copied into the batch.
+    """
+
+    _DIRECT_WRITE_SIZE = 64 * 1024
+
+    def __init__(self, out: BinaryIO, batch_size: int = 1 << 20):
+        self._out = out
+        self._batch: List[Buffer] = []
+        self._size = 0
+        self._batch_size = batch_size
+        self._on_flush: List[Callable[[], None]] = []
+        # Time spent writing to the output file and bytes written
+        self.seconds = 0.0
+        self.bytes = 0
+
+    def _write_out(self, data: Buffer) -> None:
+        started = time.perf_counter()
+        self._out.write(data)
+        self.seconds += time.perf_counter() - started
+        self.bytes += len(data)
+
+    def write(self, record: Buffer) -> None:
+        if len(record) >= self._DIRECT_WRITE_SIZE:
+            self.flush()
+            self._write_out(record)
+            return
+        self._batch.append(record)
+        self._size += len(record)
+        if self._size >= self._batch_size:
+            self.flush()
+
+    def writelines(self, records: List[Buffer]) -> None:
+        for record in records:
+            self.write(record)
+
+    def after_flush(self, callback: Callable[[], None]) -> None:
+        """Run callback once everything written so far has reached the output file"""
+        self._on_flush.append(callback)
+
+    def flush(self) -> None:
+        if self._batch:
+            self._write_out(b"".join(self._batch))
+            self._batch.clear()
+            self._size = 0
+        for callback in self._on_flush:
+            callback()
+        self._on_flush.clear()
+
+
+def _split_record(record: Buffer) -> Tuple[bytes, bytes]:
+    """Split a record into its body and line terminator"""
+    body = bytes(record).rstrip(b"\r\n")
+    return body, bytes(record[len(body) :])
+
+
+class MergeCache:
+    """Processed record blocks of earlier merges, reused for unchanged inputs
+
+    One cache file is kept per input (.sd3 file or zip member) in a folder per
+    entry directory.  An entry is reused when the input's size and
+    modification time are unchanged, or failing that when its content hash
+    (SHA-256 of a plain file, CRC-32 of a zip member) still matches.  The
+    whole cache is ignored when the merge settings or the club list change.
+    """
+
+    _VERSION = 8
+
+    def __init__(self, cache_dir: str, directory: str, settings: bytes):
+        key = hashlib.sha1(os.path.abspath(directory).encode("utf-8")).hexdigest()[:16]
+        self._cache_dir = os.path.join(cache_dir, "merge_cache", key)
+        self._directory = directory
+        self._settings = settings
+        self._used: Set[str] = set()
+        pathlib.Path(self._cache_dir).mkdir(parents=True, exist_ok=True)
+
+    def _entry_file(self, item: _MergeInput) -> str:
+        name = "\0".join((item.file_name,) + item.archives + (item.member_name or "",))
+        return os.path.join(self._cache_dir, hashlib.sha1(name.encode("utf-8")).hexdigest() + ".blk")
+
+    def _stat(self, item: _MergeInput) -> Tuple[int, int]:
+        stat = os.stat(os.path.join(self._directory, item.file_name))
+        return stat.st_size, stat.st_mtime_ns
+
+    def _content_hash(self, item: _MergeInput, data: Optional[Buffer] = None) -> bytes:
+        if item.member_crc is not None:
+            return item.member_crc.to_bytes(4, "big")
+        digest = hashlib.sha256()
+        if data is None:
+            with open(os.path.join(self._directory, item.file_name), "rb") as file:
+                for chunk in iter(lambda: file.read(1 << 20), b""):
+                    digest.update(chunk)
+        else:
+            digest.update(data)
+        return digest.digest()
+
+    def get(self, item: _MergeInput) -> Optional[_MergedInput]:
+        """Return the cached result for an input, or None if it has to be processed"""
+        entry_file = self._entry_file(item)
+        self._used.add(entry_file)
+        try:
+            with open(entry_file, "rb") as file:
+                header = pickle.load(file)
+                if header.get("version") != self._VERSION or header.get("settings") != self._settings:
+                    return None
+                stat = self._stat(item)
+                if header["stat"] != stat and header["hash"] != self._content_hash(item):
+                    return None
+                block = file.read()
+            if header["stat"] != stat:
+                # Touched but not changed - remember the new size/time so the content isn't hashed again
+                header["stat"] = stat
+                self._write(entry_file, header, (block,))
+        except FileNotFoundError:
+            return None
+        except Exception as e:  # pylint: disable=broad-except
+            logging.warning("Ignoring unreadable merge cache entry for %s: %s", item.label, e)
+            return None
+
+        merged = _MergedInput(item)
+        merged.a0 = header["a0"]
+        merged.b1 = header["b1"]
+        merged.z0 = header["z0"]
+        merged.counts = header["counts"]
+        merged.seconds = header["seconds"]
+        merged.swimmers = header["swimmers"]
+        merged.groups = header["groups"]
+        merged.issues = header["issues"]
+        merged.add(block)
+        merged.cached = True
+        return merged
+
+    def put(self, item: _MergeInput, merged: _MergedInput) -> None:
+        """Save the processed result of an input"""
+        header = {
+            "version": self._VERSION,
+            "settings": self._settings,
+            "stat": self._stat(item),
+            # Hash of the input as read - a repaired copy would never match the unchanged file
+            "hash": self._content_hash(item, None if merged.repaired else merged.source),
+            "a0": merged.a0,
+            "b1": merged.b1,
+            "z0": merged.z0,
+            "counts": merged.counts,
+            "seconds": merged.seconds,
+            "swimmers": merged.swimmers,
+            "groups": merged.groups,
+            "issues": merged.issues,
+        }
+        self._write(self._entry_file(item), header, merged.segments)
+
+    def _write(self, entry_file: str, header: dict, blocks: Iterable[Buffer]) -> None:
+        temp_file = f"{entry_file}.{get_ident()}.tmp"
+        try:
+            with open(temp_file, "wb") as file:
+                pickle.dump(header, file, protocol=pickle.HIGHEST_PROTOCOL)
+                # Written a segment at a time, so the slices of the input are not copied
+                for block in blocks:
+                    file.write(block)
+            os.replace(temp_file, entry_file)
+        except OSError as e:
+            logging.warning("Unable to save merge cache entry: %s", e)
+
+    def prune(self) -> None:
+        """Remove the entries of inputs that are no longer in the entry directory"""
+        for name in os.listdir(self._cache_dir):
+            entry_file = os.path.join(self._cache_dir, name)
+            if entry_file not in self._used:
+                try:
+                    os.remove(entry_file)
+                except OSError:
+                    pass
+
+
+def _fingerprint(fields: Tuple[bytes, ...]) -> int:
+    """64-bit hash identifying a club, entry or relay from its record type and fixed width key fields"""
+    return int.from_bytes(hashlib.blake2b(b"\0".join(fields), digest_size=8).digest(), "big")
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _seed_time(field: bytes) -> int:
+    """Seed time in hundredths of a second, with no time (NT or blank) sorting last - memoised, as seed times repeat"""
+    hundredths = decode_time(field)
+    return _NO_SEED_TIME if hundredths is None else hundredths
+
+
+_NO_SEED_TIME = 1 << 62
+
+
+def _count_records(buffers: Iterable[Buffer]) -> Dict[bytes, int]:
+    """Count the records in a list of record buffers by type"""
+    counts: Dict[bytes, int] = {}
+    for buffer in buffers:
+        data = bytes(buffer)
+        pos = 0
+        while pos < len(data):
+            if data[pos] not in _NOT_RECORD:
+                record_type = data[pos : pos + 2]
+                counts[record_type] = counts.get(record_type, 0) + 1
+            pos = data.find(b"\n", pos) + 1 or len(data)
+    return counts
+
+
+class _Deduplicator:
+    """Drops duplicate clubs, individual entries and relays across inputs
+
+    Records are fingerprinted as groups: a C1 club, a D0 entry with the
+    records that follow it (D3 etc.) and an E0 relay with its F0 swimmers.
+    Clubs are keyed on club code, entries on athlete ID and event,
+    relays on club, relay letter and event.  Only 64-bit hashes are indexed.
+
+    Policies decide which copy of a duplicate is kept:
+    first - the first copy in merge order (single pass)
+    newest - the copy from the most recently modified input file
+    fastest - the entry or relay with the fastest seed time
+    The newest and fastest policies index all inputs in a first pass.  A
+    duplicate club header is only dropped if all of its entries were dropped,
+    so that the remaining entries stay with their club.  With two passes a
+    club header without entries is also dropped when a later input holds
+    winning entries for the club, so the club is written once, with them.
+    """
+
+    POLICIES = ("first", "newest", "fastest")
+
+    def __init__(self, policy: str):
+        self.policy = policy
+        self._winners: Dict[int, Tuple[int, int]] = {}
+        # Club of the winning copy of each entry and relay
+        self._winner_clubs: Dict[int, Optional[int]] = {}
+        # Last input holding winning entries or relays of each club, built once every input is indexed
+        self._last_club_inputs: Optional[Dict[int, int]] = None
+        self._emitted: Set[int] = set()
+        self.dropped: Dict[bytes, int] = {}
+
+    @property
+    def two_pass(self) -> bool:
+        return self.policy != "first"
+
+    def _rank(self, kind: bytes, seed: int, input_time: int) -> int:
+        if self.policy == "newest":
+            return -input_time
+        if self.policy == "fastest" and kind != b"C1":
+            return seed
+        return 0
+
+    def index(self, merged: "_MergedInput", input_index: int, input_time: int) -> None:
+        """First pass - remember the winning copy of every group in an input"""
+        winners = self._winners
+        club = None
+        for _, kind, digest, seed in merged.groups:
+            if kind == b"C1":
+                # Which club header to keep follows from where the club's winning entries are
+                club = digest
+                continue
+            rank = (self._rank(kind, seed, input_time), input_index)
+            best = winners.get(digest)
+            if best is None or rank < best:
+                winners[digest] = rank
+                self._winner_clubs[digest] = club
+
+    def _last_club_input(self, club: int) -> int:
+        """Index of the last input holding winning entries or relays of a club, -1 if there are none"""
+        if self._last_club_inputs is None:
+            last: Dict[int, int] = {}
+            for digest, winner_club in self._winner_clubs.items():
+                if winner_club is not None:
+                    last[winner_club] = max(last.get(winner_club, -1), self._winners[digest][1])
+            self._last_club_inputs = last
+        return self._last_club_inputs.get(club, -1)
+
+    def filter(self, merged: "_MergedInput", input_index: int) -> Tuple[List[Buffer], Dict[bytes, int]]:
+        """Return the segments of an input without its duplicates, and the records removed by type"""
+        groups = merged.groups
+        if not groups:
+            return merged.segments, {}
+        keep = [False] * len(groups)
+        for i, (_, kind, digest, _) in enumerate(groups):
+            if kind == b"C1" or digest in self._emitted:
+                continue
+            if self.two_pass and self._winners.get(digest, (0, input_index))[1] != input_index:
+                continue
+            keep[i] = True
+            self._emitted.add(digest)
+        # Clubs are kept the first time they are seen, and again whenever they still have entries.
+        # With two passes a first copy without entries waits for a later input with the club's winning entries.
+        club = -1
+        for i, (_, kind, digest, _) in enumerate(groups):
+            if kind == b"C1":
+                club = i
+                keep[i] = digest not in self._emitted and (
+                    not self.two_pass or self._last_club_input(digest) <= input_index
+                )
+            elif keep[i] and club >= 0:
+                keep[club] = True
+        self._emitted.update(digest for i, (_, kind, digest, _) in enumerate(groups) if kind == b"C1" and keep[i])
+
+        dropped_ranges = []
+        for i, (offset, kind, _, _) in enumerate(groups):
+            if not keep[i]:
+                end = groups[i + 1][0] if i + 1 < len(groups) else merged.length
+                dropped_ranges.append((offset, end))
+                self.dropped[kind] = self.dropped.get(kind, 0) + 1
+        if not dropped_ranges:
+            return merged.segments, {}
+        kept, removed = _cut_ranges(merged.segments, dropped_ranges)
+        return kept, _count_records(removed)
+
+
+def _cut_ranges(segments: List[Buffer], ranges: List[Tuple[int, int]]) -> Tuple[List[Buffer], List[Buffer]]:
+    """Split segments into the parts outside and inside the sorted byte ranges"""
+    kept: List[Buffer] = []
+    removed: List[Buffer] = []
+    ranges_iter = iter(ranges)
+    cut_start, cut_end = next(ranges_iter)
+    offset = 0
+    for segment in segments:
+        view = memoryview(segment)
+        seg_start = offset
+        offset += len(view)
+        pos = seg_start
+        while pos < offset:
+            if pos < cut_start:
+                end = min(offset, cut_start)
+                kept.append(view[pos - seg_start : end - seg_start])
+            else:
+                end = min(offset, cut_end)
+                removed.append(view[pos - seg_start : end - seg_start])
+                if end == cut_end:
+                    cut_start, cut_end = next(ranges_iter, (1 << 62, 1 << 62))
+            pos = end
+    return kept, removed
+
+
+class _ClubGrouper:
+    """Regroups the merged records by club with an external k-way merge
+
+    Each input is cut into club blocks (a C1 record and everything up to the
+    next C1) which are sorted by club code and appended to a temporary file
+    as one sorted run.  Once every input is in, the runs are merged with a
+    heap, reading each run a chunk at a time, so memory holds one block per
+    run rather than the whole meet.  Blocks of the same club from different
+    inputs come out together under a single C1.  Records before the first C1
+    of an input are written ahead of the clubs.
+    """
+
+    _BLOCK_HEADER = struct.Struct(">HI")
+
+    def __init__(self, temp_dir: Optional[str] = None):
+        self._spool = tempfile.TemporaryFile(dir=temp_dir)
+        self._runs: List[Tuple[int, int]] = []
+        self.preamble: List[bytes] = []
+
+    def close(self) -> None:
+        self._spool.close()
+
+    @staticmethod
+    def _club_key(record: bytes) -> bytes:
+        # Club code (with its 5th character), then LSC
+        return record[_C1_TEAM] + record[_C1_TEAM_CODE_5] + record[_C1_LSC]
+
+    def add_input(self, segments: List[Buffer]) -> None:
+        """Cut an input into club blocks and spool them as one sorted run"""
+        data = b"".join(segments)
+        blocks = []
+        start = -1
+        pos = 0
+        while pos < len(data):
+            if data.startswith(b"C1", pos):
+                if start >= 0:
+                    blocks.append((self._club_key(data[start : start + SDIF_RECORD_LENGTH]), start, pos))
+                else:
+                    self.preamble.append(data[:pos])
+                start = pos
+            pos = data.find(b"\n", pos) + 1 or len(data)
+        if start < 0:
+            self.preamble.append(data)
+            return
+        blocks.append((self._club_key(data[start : start + SDIF_RECORD_LENGTH]), start, len(data)))
+        blocks.sort(key=lambda block: block[0])
+
+        self._spool.seek(0, os.SEEK_END)
+        run_start = self._spool.tell()
+        for key, block_start, block_end in blocks:
+            self._spool.write(self._BLOCK_HEADER.pack(len(key), block_end - block_start))
+            self._spool.write(key)
+            self._spool.write(data[block_start:block_end])
+        self._runs.append((run_start, self._spool.tell()))
+
+    def _read_run(self, run_index: int, start: int, end: int, chunk_size: int = 256 * 1024) -> Iterator[Tuple]:
+        """Blocks of one run as (key, run index, data), reading the spool a chunk at a time"""
+        buffer = b""
+        offset = start
+        header_size = self._BLOCK_HEADER.size
+        while True:
+            while len(buffer) < header_size and offset < end:
+                self._spool.seek(offset)
+                chunk = self._spool.read(min(chunk_size, end - offset))
+                offset += len(chunk)
+                buffer += chunk
+            if len(buffer) < header_size:
+                return
+            key_length, data_length = self._BLOCK_HEADER.unpack_from(buffer)
+            block_size = header_size + key_length + data_length
+            while len(buffer) < block_size:
+                self._spool.seek(offset)
+                chunk = self._spool.read(min(max(chunk_size, block_size - len(buffer)), end - offset))
+                offset += len(chunk)
+                buffer += chunk
+            key = buffer[header_size : header_size + key_length]
+            yield key, run_index, buffer[header_size + key_length : block_size]
+            buffer = buffer[block_size:]
+
+    def write(self, writer: "_BatchWriter", counter: "_RecordCounter") -> None:
+        """Write the clubs in code order, merging the blocks of the same club"""
+        runs = [self._read_run(i, start, end) for i, (start, end) in enumerate(self._runs)]
+        last_key = None
+        for key, _, block in heapq.merge(*runs):
+            if key == last_key:
+                # Same club as the previous block - drop its club header records
+                pos = 0
+                while block.startswith(b"C", pos):
+                    counter.add(block[pos : pos + 2], -1)
+                    pos = block.find(b"\n", pos) + 1 or len(block)
+                block = block[pos:]
+            writer.write(block)
+            last_key = key
+
+
+def _meet_name(meet_key: bytes) -> str:
+    """Readable meet name and start date from a meet key"""
+    if not meet_key:
+        return "Unknown Meet"
+    name, _, start = meet_key.decode("latin-1").partition("\0")
+    return f"{name.strip()} {start.strip()}".strip() or "Unknown Meet"
+
+
+def _is_output_file(path: str, output_files: Iterable[str]) -> bool:
+    """Whether path is one of the merged output files
+
+    The zipped output is matched too, whether or not zip_output is on now -
+    a zip file left by an earlier merge must not be merged again.  So are the
+    .part and .prev files left behind if a merge stopped while replacing one.
+    """
+    path = os.path.abspath(path)
+    for output_file in output_files:
+        output_file = os.path.abspath(output_file)
+        for name in (output_file, _zip_file_name(output_file)):
+            if path in (name, name + ".part", name + ".prev"):
+                return True
+    return False
+
+
+def _meet_suffixes(meet_keys: Iterable[bytes]) -> Dict[bytes, str]:
+    """File name suffix of the per-meet output and report of each meet, unique across the meets"""
+    suffixes: Dict[bytes, str] = {}
+    for meet_key in meet_keys:
+        suffix = re.sub(r"[^A-Za-z0-9]+", "_", _meet_name(meet_key)).strip("_") or "unknown_meet"
+        while suffix in suffixes.values():
+            suffix += "_"
+        suffixes[meet_key] = suffix
+    return suffixes
+
+
+def _zip_file_name(output_file: str) -> str:
+    """Zip file written in place of the output SD3 file when zipping the output"""
+    return os.path.splitext(output_file)[0] + ".zip"
+
+
+def _with_suffix(file_name: str, suffix: str) -> str:
+    """Add a suffix to a file name, before its extension"""
+    root, ext = os.path.splitext(file_name)
+    return f"{root}_{suffix}{ext}"
+
+
+def _list_nested(
+    file_name: str,
+    archives: Tuple[str, ...],
+    members: Iterator[StreamedMember],
+    inputs: List[_MergeInput],
+    skipped: List[str],
+) -> None:
+    """Add the SD3 members of a streamed nested zip file, and of the zip files nested in it, to inputs
+
+    Members compressed with a method that can't be streamed are logged and added to skipped instead.
+    """
+    for member in members:
+        if member.method not in STREAMED_METHODS and (SD3_NAME.search(member.name) or ZIP_NAME.search(member.name)):
+            where = "/".join((file_name,) + archives)
+            method = zipfile.compressor_names.get(member.method, member.method)
+            logging.warning(
+                "Skipping %s in zip file %s - %s compression can't be streamed", member.name, where, method
+            )
+            skipped.append(f"{member.name} in zip file: {where}: {method} compression is not supported in nested zips")
+        elif SD3_NAME.search(member.name):
+            # The meet is read now, as going back to a member later means streaming the zip file again
+            head = member.read(4096)
+            member.skip()
+            inputs.append(_MergeInput(file_name, member.name, member.crc, member.size, archives, _meet_key(head)))
+        elif ZIP_NAME.search(member.name):
+            _list_nested(file_name, archives + (member.name,), stream_zip(member), inputs, skipped)
+
+
+def _stream_nested(directory: str, inputs: Iterable[_MergeInput]) -> Iterator[_MergeInput]:
+    """The inputs in order, with the data of nested zip members attached from one pass over each nested zip file"""
+    members: Optional[Iterator[StreamedMember]] = None
+    streaming = None
+    try:
+        for item in inputs:
+            if item.archives:
+                if (item.file_name, item.archives) != streaming:
+                    if members is not None:
+                        members.close()
+                    members = nested_members(os.path.join(directory, item.file_name), list(item.archives))
+                    streaming = (item.file_name, item.archives)
+                item.data = _find_member(members, item.member_name).read()
+            yield item
+    finally:
+        if members is not None:
+            members.close()
+
+
+def _ordered_map(executor: Executor, fn: Callable, items: Iterable, window: int) -> Iterator:
+    """Like Executor.map, but with at most window items in flight so results are not all held at once"""
+    pending: deque = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
 
 
 class SDIF_Merge(Thread):
     def __init__(self, config: appConfig):
         super().__init__()
         self._config: appConfig = config
+        self.success: bool = False
+        self.cancelled: bool = False
+        self._cancel_event = Event()
+        self._progress = _ProgressTracker()
+        # Input files left out of the merge because they couldn't be read, with the reason
+        self._skipped: List[str] = []
+        # SD3 or zip files written by the merge
+        self.output_files: List[str] = []
+
+    def cancel(self) -> None:
+        """Stop the merge at the next check between records, leaving the previous output file in place"""
+        self._cancel_event.set()
+
+    def progress(self) -> MergeProgress:
+        """Files and bytes merged so far - can be called from any thread"""
+        return self._progress.snapshot()
+
+    def _check_cancelled(self) -> None:
+        if self._cancel_event.is_set():
+            raise MergeCancelled()
 
     def run(self):
         logging.info("Merging SDIF files...")
@@ -32,64 +1500,149 @@ class SDIF_Merge(Thread):
 
         logging.info("Merging SDIF files...")
 
-        self.merge_sdif_files(self._entry_file_directory, self._output_sd3_file)
+        self.success = self.merge_sdif_files(self._entry_file_directory, self._output_sd3_file)
 
-    def fix_c1_record(self, clubdata, line):
+    def fix_c1_record(self, clubs: ClubRegistry, record: Buffer) -> Buffer:
         # Update the C1 record with the correct country and region codes
+        # SDIF is fixed width, so the record is patched in place as bytes. Names are only decoded for logging.
+
+        prov_code = bytes(record[_C1_LSC]).strip().decode("latin-1")
+        team_code = (bytes(record[_C1_TEAM]).strip() + bytes(record[_C1_TEAM_CODE_5]).strip()).decode("latin-1")
+        cur_country = bytes(record[_C1_COUNTRY]).strip()
+
+        # Duplicate club codes are flagged when the registry is built and never match here
+
+        province = clubs.province(team_code)
+        if province is None:
+            return record
 
-        prov_code = line[11:12].strip()
-        team_code = line[13:17].strip() + line[149:150].strip()
-        cur_country = line[139:142].strip()
-        cur_name = line[17:47].strip()
+        fix_country = self._set_country and cur_country != b"CAN"
+        fix_region = self._set_region and prov_code != province
+        if not (fix_country or fix_region):
+            return record
 
-        mylist = list(filter(lambda person: person["Club Code"] == team_code, clubdata))
+        body, terminator = _split_record(record)
+        patched = bytearray(body.ljust(SDIF_RECORD_LENGTH))
+        cur_name = bytes(record[_C1_NAME]).strip().decode("latin-1")
+        if fix_country:
+            logging.info("Country code updated for club %s %s", team_code, cur_name)
+            patched[_C1_COUNTRY] = b"CAN"
+        if fix_region:
+            logging.info("Region code updated for club %s %s", team_code, cur_name)
+            patched[_C1_LSC] = province.encode("latin-1")[:2].ljust(2)
+        patched += terminator
+        return patched
 
-        # The club list should only have one entry per club. If there is more than one, we have a problem and we skip it
+    def merge_sdif_files(self, directory, output_file) -> bool:
+        trace_memory = self._config.get_bool("trace_memory") and not tracemalloc.is_tracing()
+        if trace_memory:
+            tracemalloc.start()
+        try:
+            return self._merge_directory(directory, output_file)
+        except MergeCancelled:
+            logging.warning("Merge cancelled - the previous output and report files were left unchanged")
+            self.cancelled = True
+            return False
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
 
-        if len(mylist) == 1:
-            if self._set_country and (cur_country != "CAN" or cur_country == None):
-                logging.info("Country code updated for club %s %s", team_code, cur_name)
-                line = line[:139] + "CAN" + line[142:]
-            if self._set_region and (prov_code != mylist[0]["Province"]):
-                logging.info("Region code updated for club %s %s", team_code, cur_name)
-                line = line[:11] + mylist[0]["Province"] + line[13:]
-        return line
+    def _merge_directory(self, directory, output_file) -> bool:
+        # Statistics of the stages before the merge, copied into the statistics of each merged file
+        self._setup_stats = MergeStats()
 
-    def merge_sdif_files(self, directory, output_file):
-        # Get a list of all the files in the directory
-        files = os.listdir(directory)
-        # Create a list of files to process
-        files_to_process = [f for f in files if f.endswith(".sd3") or f.endswith(".zip")]
+        with self._setup_stats.measure("Scan directory"):
+            # Create a list of files to process, leaving out our own output if it is written to the same directory
+            split = self._config.get_bool("split_by_meet")
+            files_to_process = find_input_files(
+                directory,
+                self._config.get_bool("include_subfolders"),
+                lambda path: _is_output_file(path, [output_file]),
+            )
 
         if len(files_to_process) == 0:
             logging.info("No SD3 or zip files to process")
-            return
+            return False
 
+        clubdata = None
         if self._set_country or self._set_region:
-            clubdata = self.load_remote_csv_file(CLUB_CSV_URL)
+            with self._setup_stats.measure("Load club list"):
+                clubdata = self.load_club_list()
             # Be sure we have somehting
             if len(clubdata) == 0:
                 logging.error("Club CSV File not found - unable to set country and region codes")
-                return
+                return False
 
+        with self._setup_stats.measure("List inputs"):
+            inputs = self._list_inputs(directory, files_to_process)
+            if split:
+                inputs = self._without_meet_outputs(directory, output_file, inputs)
+        dedup = self._deduplicator()
+        passes = 2 if dedup is not None and dedup.two_pass else 1
+        self._progress.add_total(len(inputs), sum(item.size for item in inputs) * passes)
+        cache = self._merge_cache(directory, clubdata, dedup is not None)
 
-        merged_a0_record = "A01V3      01                              SDIF MERGE UTILITY            SDIF MERGE          unknown     07012024                                               "
-        current_date = datetime.datetime.now().strftime("%m%d%Y")
-        merged_a0_record = merged_a0_record[:80] + current_date + merged_a0_record[88:]
+        if split:
+            success = self._merge_by_meet(directory, output_file, inputs, clubdata, cache)
+        else:
+            success = self._merge_inputs(directory, output_file, self._output_report_file, inputs, clubdata, cache)
+        if success and cache is not None:
+            cache.prune()
+        return success
 
+    def _merge_inputs(
+        self,
+        directory,
+        output_file,
+        report_file_name,
+        inputs: List[_MergeInput],
+        clubdata: Optional[ClubRegistry],
+        cache: Optional[MergeCache],
+        meet_name: Optional[str] = None,
+    ) -> bool:
+        """Merge a list of inputs into one output SD3 file and report"""
+        merged_a0_record = b"A01V3      01                              SDIF MERGE UTILITY            SDIF MERGE          unknown     07012024                                               "
+        current_date = datetime.datetime.now().strftime("%m%d%Y").encode("ascii")
+        merged_a0_record = merged_a0_record[:105] + current_date + merged_a0_record[113:]
+
+        outputs = _AtomicFiles()
         try:
-            report_file = open(self._output_report_file, "w")
+            report = outputs.open(report_file_name, "w")
         except FileNotFoundError:
-            logging.error("Unable to open report file: %s", self._output_report_file)
-            return
+            logging.error("Unable to open report file: %s", report_file_name)
+            return False
+        zip_output = self._config.get_bool("zip_output")
+        # A zipped report is collected in memory, for both the zip file and the report file
+        report_file = io.StringIO() if zip_output else report.file
+        output_path = _zip_file_name(output_file) if zip_output else output_file
 
         report_file.write("SDIF Merge Report\n")
         report_file.write("====================================\n\n")
         report_file.write(f"Entry File Directory: {directory}\n")
-        report_file.write(f"Output SD3 File: {output_file}\n\n")
+        if meet_name is not None:
+            report_file.write(f"Meet: {meet_name}\n")
+        if zip_output:
+            report_file.write(f"Output SD3 File: {os.path.basename(output_file)} in zip file: {output_path}\n\n")
+        else:
+            report_file.write(f"Output SD3 File: {output_file}\n\n")
         report_file.write(f"Files Processed:\n\n")
 
-        with open(output_file, "w") as out:
+        workers = self._worker_count()
+
+        stats = MergeStats(self._setup_stats)
+        dedup = self._deduplicator()
+        handlers = self._record_handlers(clubdata, dedup is not None, stats)
+        validator = self._validator()
+        issues: List[RecordIssue] = []
+
+        self.output_files.append(output_path)
+        # The report and output replace the previous files together, once both are complete
+        with outputs, _ZipOutput(
+            outputs.open(output_path).file,
+            os.path.basename(output_file),
+            self._config.get_int("zip_level"),
+            zip_output,
+        ) as archive, ThreadPoolExecutor(max_workers=workers) as executor:
             # File Processing
             # The first two characters represent the record type.
             # A0 - Generating Program Information
@@ -102,85 +1655,556 @@ class SDIF_Merge(Thread):
             # Z0 - End of File Record
             # When merging, use the A0 and B1 record from the first file to start the output file.
             # For each file copy all records except the A0, B1 and Z0 records to the output file. Keep a count of each record type.
-            # At the end copy the last Z0 record to the output file.
+            # With group_by_club the clubs are instead written in club code order once all files are read.
+            # At the end write a Z0 record with the counts of the merged file, based on the last Z0 record read.
+            #
+            # The inputs are read, decoded and C1-fixed in parallel by the worker pool and written here in input order.
+            # Each line is routed by its record type through the dispatch table built above.
 
             files_processed = 0
             latest_Z0 = None
+            writer = _BatchWriter(archive.records)
+            counter = _RecordCounter()
+            grouper = _ClubGrouper() if self._config.get_bool("group_by_club") else None
+            started = time.perf_counter()
 
-            for f in files_to_process:
-                if f.endswith(".sd3"):
-                    with open(os.path.join(directory, f), "r") as file:
-                        for line in file:
-                            if line.startswith("A0") and files_processed == 0:
-                                # Add logic to change the date in the A0 record
-                                out.write(merged_a0_record)
-                            elif line.startswith("B1") and files_processed == 0:
-                                out.write(line)
-                            elif line.startswith("C1") and (self._set_country or self._set_region):
-                                line = self.fix_c1_record(clubdata, line)
-                                out.write(line)
-                            elif line.startswith("Z0"):
-                                latest_Z0 = line
-                            else:
-                                out.write(line)
-                    logging.info("Processed file: %s", f)
-                    report_file.write(f"Processed file: {f}\n")
-                    files_processed += 1
-                elif f.endswith(".zip"):
-                    with zipfile.ZipFile(os.path.join(directory, f), "r") as zfile:
-                        for zf in zfile.infolist():
-                            if re.match(r".*\.sd3", zf.filename):
-                                compressed_file = zfile.open(zf)
-                                sd3_file = io.TextIOWrapper(compressed_file)
-                                with sd3_file as file:
-                                    for line in file:
-                                        if line.startswith("A0") and files_processed == 0:
-                                            # Add logic to change the date in the A0 record
-                                            out.write(merged_a0_record)
-                                        elif line.startswith("B1") and files_processed == 0:
-                                            out.write(line)
-                                        elif line.startswith("C1") and (self._set_country or self._set_region):
-                                            line = self.fix_c1_record(clubdata, line)
-                                            out.write(line)
-                                        elif line.startswith("Z0"):
-                                            latest_Z0 = line
-                                        else:
-                                            out.write(line)
-                                logging.info("Processed file: %s in zip file: %s", zf.filename, f)
-                                report_file.write(f"Processed file: {zf.filename} in zip file: {f}\n")
-                                files_processed += 1
-            out.write(latest_Z0)
+            def read_input(item: _MergeInput) -> _MergedInput:
+                if cache is not None:
+                    with stats.measure("Merge cache", item.label) as lookup:
+                        merged = cache.get(item)
+                        if merged is not None:
+                            lookup.bytes = merged.length
+                            lookup.records = sum(merged.counts.values())
+                    if merged is not None:
+                        # Streamed data of a nested zip member is not needed
+                        item.data = None
+                        self._progress.add_bytes(item.size)
+                        return merged
+                merged = self._read_input(directory, item, handlers, validator, stats)
+                if cache is not None:
+                    with stats.measure("Merge cache", item.label) as save:
+                        cache.put(item, merged)
+                        save.bytes = merged.length
+                return merged
+
+            if dedup is not None and dedup.two_pass:
+                # Find the copy of each duplicate to keep before anything is written
+                input_times = [self._input_time(directory, item) for item in inputs]
+                for input_index, merged in enumerate(
+                    _ordered_map(executor, read_input, _stream_nested(directory, inputs), workers * 2)
+                ):
+                    self._check_cancelled()
+                    dedup.index(merged, input_index, input_times[input_index])
+                    merged.close()
+
+            for input_index, merged in enumerate(
+                _ordered_map(executor, read_input, _stream_nested(directory, inputs), workers * 2)
+            ):
+                self._check_cancelled()
+                if files_processed == 0:
+                    if merged.a0 is not None:
+                        writer.write(merged_a0_record + (_split_record(merged.a0)[1] or SDIF_LINE_END))
+                        counter.add(b"A0")
+                    if merged.b1 is not None:
+                        writer.write(merged.b1)
+                        counter.add(b"B1")
+                segments = merged.segments
+                counter.add_input(merged)
+                if dedup is not None:
+                    segments, removed = dedup.filter(merged, input_index)
+                    for record_type, count in removed.items():
+                        counter.add(record_type, -count)
+                if grouper is not None:
+                    grouper.add_input(segments)
+                    merged.close()
+                else:
+                    writer.writelines(segments)
+                    writer.after_flush(merged.close)
+                if merged.z0 is not None:
+                    latest_Z0 = merged.z0
+                if merged.issues:
+                    logging.warning("%s invalid records in %s", len(merged.issues), merged.item.label)
+                    issues.extend(merged.issues)
+                unchanged = " (unchanged)" if merged.cached else ""
+                logging.info("Processed file: %s%s", merged.item.label, unchanged)
+                report_file.write(f"Processed file: {merged.item.label}{unchanged}\n")
+                files_processed += 1
+                self._progress.file_done()
+            self._check_cancelled()
+            if grouper is not None:
+                writer.writelines(grouper.preamble)
+                grouper.write(writer, counter)
+                grouper.close()
+            counter.add(b"Z0")
+            writer.write(counter.z0_record(latest_Z0))
+            writer.flush()
+            elapsed = time.perf_counter() - started
+            stats.add(
+                "Write output",
+                _StageStats(writer.seconds, writer.bytes, sum(counter.counts.values()), _peak_memory()),
+            )
+            stats.add("Merge", _StageStats(elapsed, writer.bytes, sum(counter.counts.values()), _peak_memory()))
             logging.info("Processed %s files", files_processed)
             report_file.write(f"Processed {files_processed} files\n")
+            self._write_skipped(report_file)
+            self._write_record_counts(report_file, counter, elapsed)
+            if validator is not None:
+                self._write_issues(report_file, issues, validator.action)
+            if dedup is not None:
+                self._write_duplicates(report_file, dedup)
+            stats.write_report(report_file)
+            if zip_output:
+                report_text = report_file.getvalue()
+                archive.close(os.path.basename(report_file_name), report_text)
+                report.file.write(report_text)
+        if self._config.get_bool("stats_json"):
+            stats_file = os.path.splitext(report_file_name)[0] + ".json"
+            try:
+                stats.write_json(
+                    stats_file,
+                    directory=directory,
+                    output_file=output_path,
+                    meet=meet_name,
+                    files=files_processed,
+                    elapsed=round(elapsed, 6),
+                )
+            except OSError as e:
+                logging.warning("Unable to write merge statistics %s: %s", stats_file, e)
+        return True
+
+    def _merge_by_meet(
+        self,
+        directory,
+        output_file,
+        inputs: List[_MergeInput],
+        clubdata: Optional[ClubRegistry],
+        cache: Optional[MergeCache],
+    ) -> bool:
+        """Partition the inputs by the meet in their B1 record and merge each meet to its own files concurrently"""
+        meets = self._meets(directory, inputs)
+
+        if len(meets) == 1:
+            return self._merge_inputs(directory, output_file, self._output_report_file, inputs, clubdata, cache)
+
+        logging.info("Entry files are for %s meets - merging each meet separately", len(meets))
+        jobs = []
+        for (meet_key, meet_inputs), suffix in zip(meets.items(), _meet_suffixes(meets).values()):
+            meet_name = _meet_name(meet_key)
+            meet_output = _with_suffix(output_file, suffix)
+            meet_report = _with_suffix(self._output_report_file, suffix)
+            logging.info("Meet %s: %s files to %s", meet_name, len(meet_inputs), meet_output)
+            jobs.append((meet_output, meet_report, meet_inputs, meet_name))
+
+        with ThreadPoolExecutor(max_workers=min(len(jobs), self._worker_count())) as executor:
+            results = list(
+                executor.map(
+                    lambda job: self._merge_inputs(directory, job[0], job[1], job[2], clubdata, cache, job[3]), jobs
+                )
+            )
+        return all(results)
+
+    @staticmethod
+    def _meets(directory, inputs: List[_MergeInput]) -> Dict[bytes, List[_MergeInput]]:
+        """Inputs grouped by the meet in their B1 record, meets in the order they are first seen"""
+        meets: Dict[bytes, List[_MergeInput]] = {}
+        for item in inputs:
+            item.meet = item.meet_key(directory)
+            meets.setdefault(item.meet, []).append(item)
+        return meets
+
+    def _without_meet_outputs(self, directory, output_file, inputs: List[_MergeInput]) -> List[_MergeInput]:
+        """Leave out the per-meet output files of an earlier merge of the same meets
+
+        Their names come from the meets of the inputs, so unlike the output
+        file they can only be recognised once the inputs are listed.
+        """
+        meet_outputs = [
+            _with_suffix(output_file, suffix) for suffix in _meet_suffixes(self._meets(directory, inputs)).values()
+        ]
+        return [item for item in inputs if not _is_output_file(os.path.join(directory, item.file_name), meet_outputs)]
+
+    def _write_skipped(self, report_file) -> None:
+        """Input files that were left out because they couldn't be read"""
+        if not self._skipped:
+            return
+        report_file.write("\nFiles Skipped:\n\n")
+        for skipped in self._skipped:
+            report_file.write(f"{skipped}\n")
+
+    def _write_record_counts(self, report_file, counter: _RecordCounter, elapsed: float) -> None:
+        """Record counts of the merged file, and how fast the records of each type were split"""
+        report_file.write("\nRecords Written:\n\n")
+        for record_type in sorted(counter.counts):
+            count = counter.counts[record_type]
+            rate = counter.rate(record_type)
+            report_file.write(f"{record_type.decode('latin-1'):<4}{count:>10}{rate:>14,.0f} records/sec\n")
+        report_file.write(f"Swimmers: {len(counter.swimmers)}\n")
+        report_file.write(f"Merge time: {elapsed:.3f} seconds\n")
 
-    def csv_to_dict(self, file_path):
-        data_dict = []
-        with open(file_path, "r") as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                data_dict.append(row)
-        return data_dict
+    # Invalid records listed in the report, the rest are only counted
+    _MAX_REPORTED_ISSUES = 1000
 
-    def load_remote_csv_file(self, url) -> list:
+    def _write_issues(self, report_file, issues: List[RecordIssue], action: str) -> None:
+        """Records that failed validation, with the file and line they were read from"""
+        report_file.write("\nRecord Validation:\n\n")
+        if not issues:
+            report_file.write("No invalid records found\n")
+            return
+        outcome = {"report": "kept", "pad": "padded if the wrong length, otherwise kept", "drop": "dropped"}[action]
+        report_file.write(f"{len(issues)} invalid records ({outcome}):\n")
+        for issue in issues[: self._MAX_REPORTED_ISSUES]:
+            report_file.write(f"{issue.source} line {issue.line}: {issue.record_type} - {issue.message}\n")
+        if len(issues) > self._MAX_REPORTED_ISSUES:
+            report_file.write(f"... and {len(issues) - self._MAX_REPORTED_ISSUES} more\n")
+
+    def _write_duplicates(self, report_file, dedup: _Deduplicator) -> None:
+        """Duplicates dropped by the duplicate detection"""
+        report_file.write(f"\nDuplicates Removed (keeping the {dedup.policy} copy):\n\n")
+        report_file.write(f"Clubs: {dedup.dropped.get(b'C1', 0)}\n")
+        report_file.write(f"Individual entries: {dedup.dropped.get(b'D0', 0)}\n")
+        report_file.write(f"Relays: {dedup.dropped.get(b'E0', 0)}\n")
+
+    def _deduplicator(self) -> Optional[_Deduplicator]:
+        """Duplicate detection for this merge, or None if turned off"""
+        policy = self._config.get_str("dedup_policy").lower()
+        if policy not in _Deduplicator.POLICIES:
+            if policy != "off":
+                logging.warning("Unknown duplicate policy %s - duplicates will not be removed", policy)
+            return None
+        return _Deduplicator(policy)
+
+    def _validator(self) -> Optional[RecordValidator]:
+        """Record validation for this merge, or None if turned off"""
+        action = self._config.get_str("validation").lower()
+        if action not in RecordValidator.ACTIONS:
+            if action != "off":
+                logging.warning("Unknown validation setting %s - records will not be validated", action)
+            return None
+        return RecordValidator(action)
+
+    def _input_time(self, directory, item: _MergeInput) -> int:
+        """Modification time of the file an input comes from"""
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            logging.error("Error downloading CSV file")
-            logging.error(e)
-            return []
-        
-        csv_data = io.StringIO(response.text)
-        reader = csv.DictReader(csv_data)
+            return os.stat(os.path.join(directory, item.file_name)).st_mtime_ns
+        except OSError:
+            return 0
+
+    def _list_inputs(self, directory, files_to_process) -> List[_MergeInput]:
+        """Expand the files to merge into the SD3 streams to read, in merge order
+
+        Files that can't be read are logged and left out, so the rest are still merged.
+        """
+        inputs: List[_MergeInput] = []
+        self._skipped = []
+        for f in files_to_process:
+            path = os.path.join(directory, f)
+            file_inputs: List[_MergeInput] = []
+            try:
+                if SD3_NAME.search(f):
+                    file_inputs.append(_MergeInput(f, size=os.path.getsize(path)))
+                elif ZIP_NAME.search(f):
+                    with zipfile.ZipFile(path, "r") as zfile:
+                        for zf in zfile.infolist():
+                            if SD3_NAME.search(zf.filename):
+                                file_inputs.append(_MergeInput(f, zf.filename, zf.CRC, zf.file_size))
+                            elif ZIP_NAME.search(zf.filename):
+                                # Zip files in the zip file are streamed, without extracting them
+                                with zfile.open(zf) as nested:
+                                    _list_nested(f, (zf.filename,), stream_zip(nested), file_inputs, self._skipped)
+            except _UNREADABLE_INPUT as e:
+                logging.warning("Skipping unreadable file %s: %s", f, e)
+                self._skipped.append(f"{f}: {e}")
+                continue
+            inputs.extend(file_inputs)
+        return inputs
+
+    def _merge_cache(self, directory, clubdata: Optional[ClubRegistry], dedup: bool) -> Optional[MergeCache]:
+        """Cache of processed inputs for incremental merges, or None if turned off"""
+        if not self._config.get_bool("incremental_merge"):
+            return None
+        settings = hashlib.sha256()
+        validator = self._validator()
+        validation = validator.action if validator is not None else "off"
+        settings.update(f"{self._set_country}:{self._set_region}:{dedup}:{validation}:".encode("ascii"))
+        if clubdata is not None:
+            settings.update(clubdata.fingerprint())
+        try:
+            return MergeCache(self._config.get_config_dir(), directory, settings.digest())
+        except OSError as e:
+            logging.warning("Unable to use the merge cache: %s", e)
+            return None
+
+    def _worker_count(self) -> int:
+        workers = self._config.get_int("merge_workers")
+        if workers <= 0:
+            workers = os.cpu_count() or 1
+        return workers
+
+    def _record_handlers(self, clubdata, dedup: bool, stats: MergeStats) -> _RecordHandlers:
+        """Record type dispatch tables, built once per merge"""
+        handlers: Dict[bytes, Callable[[_MergedInput, memoryview], None]] = {
+            b"A0": _MergedInput.keep_a0,
+            b"B1": _MergedInput.keep_b1,
+            b"Z0": _MergedInput.keep_z0,
+        }
+        observers: Dict[bytes, Callable[[_MergedInput, int, bytes], None]] = {}
+        if self._set_country or self._set_region:
+
+            def fix_c1(merged: _MergedInput, record: memoryview) -> None:
+                started = time.perf_counter()
+                merged.add(self.fix_c1_record(clubdata, record))
+                stats.add("Fix C1", _StageStats(time.perf_counter() - started, len(record), 1), merged.item.label)
+
+            handlers[b"C1"] = fix_c1
+
+        if dedup:
+            # Each club, entry and relay starts a group of records that can be dropped as a duplicate.
+            # Entries and relays are only read, so the kept ones are written as long unchanged runs.
+
+            def club(merged: _MergedInput, record: memoryview) -> None:
+                # Keyed on the club code alone - copies of a club with a wrong LSC or country are the same club
+                data = bytes(record)
+                digest = _fingerprint((b"C1", data[_C1_TEAM], data[_C1_TEAM_CODE_5]))
+                merged.groups.append((merged.length, b"C1", digest, _NO_SEED_TIME))
+                fix_club(merged, record)
+
+            def entry(merged: _MergedInput, offset: int, data: bytes) -> None:
+                athlete = data[_D0_USS_NUMBER]
+                if not athlete.strip():
+                    athlete = data[_D0_NAME]
+                digest = _fingerprint((b"D0", athlete, data[_D0_EVENT], data[_D0_EVENT_AGE]))
+                merged.groups.append((offset, b"D0", digest, _seed_time(data[_D0_SEED_TIME])))
+
+            def relay(merged: _MergedInput, offset: int, data: bytes) -> None:
+                digest = _fingerprint((b"E0", data[_E0_TEAM], data[_E0_EVENT], data[_E0_EVENT_AGE]))
+                merged.groups.append((offset, b"E0", digest, _seed_time(data[_E0_SEED_TIME])))
+
+            fix_club = handlers.get(b"C1", _MergedInput.add)
+            handlers[b"C1"] = club
+            observers[b"D0"] = entry
+            observers[b"E0"] = relay
+        return _RecordHandlers(handlers, observers)
+
+    def _read_input(
+        self,
+        directory,
+        item: _MergeInput,
+        handlers: _RecordHandlers,
+        validator: Optional[RecordValidator] = None,
+        stats: Optional[MergeStats] = None,
+    ) -> _MergedInput:
+        """Split one SD3 stream into records and route them through the dispatch table - runs on the worker pool"""
+        if stats is None:
+            stats = MergeStats()
+        merged = _MergedInput(item)
+        with stats.measure("Read input", item.label) as read:
+            data = item.read(directory)
+            read.bytes = len(data)
+        if validator is not None:
+            with stats.measure("Validate", item.label) as validate:
+                merged.issues, repaired = validator.check(data, item.label)
+                validate.bytes = len(data)
+            if repaired is not None:
+                if isinstance(data, mmap.mmap):
+                    data.close()
+                data = repaired
+                merged.repaired = True
+        with stats.measure("Split records", item.label) as split:
+            self._split_records(merged, data, handlers)
+            split.bytes = len(data)
+            split.records = sum(merged.counts.values())
+        return merged
+
+    def _split_records(self, merged: _MergedInput, data: Union[bytes, mmap.mmap], handlers: _RecordHandlers) -> None:
+        """Route each record of an input through the dispatch tables, keeping unchanged runs as slices"""
+        merged.source = data
+        view = memoryview(data)
+        dispatch = handlers.rewrite.get
+        observe = handlers.observe.get if handlers.observe else None
+        counts = merged.counts
+        swimmers = merged.swimmers
+        uss_start, uss_end = _D0_USS_NUMBER.start, _D0_USS_NUMBER.stop
+        name_start, name_end = _D0_NAME.start, _D0_NAME.stop
+        # Time is charged to a record type whenever the type changes, so the clock is only read between runs
+        seconds = merged.seconds
+        clock = time.perf_counter
+        timed_type = None
+        timed_from = clock()
+        size = len(data)
+        pos = 0
+        run_start = 0
+        reported = 0
+        check_at = _PROGRESS_BYTES
+        while pos < size:
+            if pos >= check_at:
+                # Progress and the cancel check run between records, every _PROGRESS_BYTES of input
+                self._progress.add_bytes(pos - reported)
+                reported = pos
+                check_at = pos + _PROGRESS_BYTES
+                self._check_cancelled()
+            end = data.find(b"\n", pos) + 1 or size
+            if data[pos] in _NOT_RECORD:
+                if run_start < pos:
+                    merged.add(view[run_start:pos])
+                run_start = pos = end
+                continue
+            record_type = data[pos : pos + 2]
+            counts[record_type] = counts.get(record_type, 0) + 1
+            if record_type != timed_type:
+                now = clock()
+                seconds[timed_type] = seconds.get(timed_type, 0.0) + now - timed_from
+                timed_type, timed_from = record_type, now
+            if record_type == b"D0":
+                # Swimmers are identified by their registration number, or by name if it is blank
+                swimmers.add(data[pos + uss_start : pos + uss_end].strip() or data[pos + name_start : pos + name_end])
+            if observe is not None:
+                observer = observe(record_type)
+                if observer is not None:
+                    # Where the record will be in the output - after the unchanged run so far
+                    observer(merged, merged.length + pos - run_start, data[pos:end])
+            handler = dispatch(record_type)
+            crlf = data[end - 2 : end] == SDIF_LINE_END
+            if handler is not None or not crlf:
+                # Records without a handler are copied unchanged as one slice of the input
+                if run_start < pos:
+                    merged.add(view[run_start:pos])
+                if crlf:
+                    record = view[pos:end]
+                else:
+                    # Records must end with CR LF - LF only or missing line ends are replaced
+                    record = memoryview(bytes(view[pos:end]).rstrip(b"\r\n") + SDIF_LINE_END)
+                if handler is None:
+                    merged.add(record)
+                else:
+                    handler(merged, record)
+                run_start = end
+            pos = end
+        if run_start < size:
+            merged.add(view[run_start:size])
+        view.release()
+        seconds[timed_type] = seconds.get(timed_type, 0.0) + clock() - timed_from
+        # The time before the first record was charged to None
+        del seconds[None]
+        self._progress.add_bytes(size - reported)
+
+    def club_source(self) -> Optional[ClubDataSource]:
+        """Select the club list source from the configuration"""
+        csv_file = self._config.get_str("csv_file")
+        if len(csv_file) > 0:
+            return LocalClubSource(csv_file)
+        if CLUB_CSV_URL is None:
+            return None
+        timeout = self._config.get_float("club_csv_timeout")
+        if not self._config.get_bool("club_cache"):
+            return RemoteClubSource(CLUB_CSV_URL, timeout)
+        ttl = self._config.get_float("club_cache_ttl") * 3600
+        return CachedClubSource(CLUB_CSV_URL, ClubCSVCache(self._config.get_config_dir(), ttl, timeout))
+
+    def load_club_list(self) -> ClubRegistry:
+        """Load the club master list from the configured source"""
+        source = self.club_source()
+        if source is None:
+            logging.error("No club CSV file or URL configured")
+            return ClubRegistry()
+        logging.info(source.describe())
+        return source.load()
+
+
+class SDIF_Watch(Thread):
+    """Watch mode - re-merges whenever the entry file directory changes
+
+    The directory is polled for new, changed or removed .sd3/.zip files.  A
+    burst of arrivals is merged once the directory has been quiet for the
+    debounce time.  Merges are incremental, so only changed inputs are read.
+    """
+
+    def __init__(self, config: appConfig):
+        super().__init__(daemon=True)
+        self._config: appConfig = config
+        self._stop_event = Event()
+        self._merge: Optional[SDIF_Merge] = None
+        self.merges: int = 0
+        # Files written by the last merge - per-meet outputs are only known once they are written
+        self._output_files: List[str] = []
+
+    def stop(self) -> None:
+        """Stop watching, cancelling a merge that is running"""
+        self._stop_event.set()
+        merge = self._merge
+        if merge is not None:
+            merge.cancel()
+
+    def run(self):
+        directory = self._config.get_str("entry_file_directory")
+        interval = self._config.get_float("watch_interval")
+        debounce = self._config.get_float("watch_debounce")
+        logging.info("Watching %s for new or changed entry files", directory)
+
+        merged_snapshot = None
+        failed_snapshot = None
+        snapshot = None
+        changed_at = 0.0
+        while not self._stop_event.is_set():
+            current = self._scan(directory)
+            if current != snapshot:
+                # The first scan merges straight away, later changes wait for the directory to settle
+                changed_at = time.monotonic() if snapshot is not None else 0.0
+                snapshot = current
+            if (
+                snapshot != merged_snapshot
+                and snapshot != failed_snapshot
+                and (changed_at == 0.0 or time.monotonic() - changed_at >= debounce)
+            ):
+                self._merge = SDIF_Merge(self._config)
+                if self._stop_event.is_set():
+                    break
+                try:
+                    self._merge.run()
+                    success = self._merge.success
+                    self._output_files = self._merge.output_files
+                except Exception:  # pylint: disable=broad-except
+                    logging.exception("Merge failed")
+                    success = False
+                finally:
+                    self._merge = None
+                if self._stop_event.is_set():
+                    break
+                if not success:
+                    # Keep watching - the merge is tried again once the directory changes
+                    logging.warning("Merge failed - waiting for the entry files to change")
+                    failed_snapshot = snapshot
+                    continue
+                self.merges += 1
+                # Outputs that were in the directory when the merge started are no longer scanned
+                merged_snapshot = {
+                    name: size_time
+                    for name, size_time in snapshot.items()
+                    if not self._excluded(os.path.join(directory, name))
+                }
+            self._stop_event.wait(interval)
+        logging.info("Stopped watching %s", directory)
+
+    def _scan(self, directory: str) -> Dict[str, Tuple[int, int]]:
+        """Size and modification time of every input file in the directory"""
+        snapshot = {}
+        try:
+            files = find_input_files(directory, self._config.get_bool("include_subfolders"), self._excluded)
+            for name in files:
+                try:
+                    stat = os.stat(os.path.join(directory, name))
+                except OSError:
+                    continue
+                snapshot[name] = (stat.st_size, stat.st_mtime_ns)
+        except OSError as e:
+            logging.warning("Unable to read entry file directory: %s", e)
+        return snapshot
 
-        data = [row for row in reader]
-        return data
-    
-    
-        
+    def _excluded(self, path: str) -> bool:
+        """Whether a file in the entry file directory is one of the merge's own outputs"""
+        return _is_output_file(path, [self._config.get_str("output_sd3_file")] + self._output_files)
 
 
 if __name__ == "__main__":
     x = SDIF_Merge(appConfig())
-    clublist = x.load_remote_csv_file(CLUB_CSV_URL)
-    print(clublist)
\ No newline at end of file
+    clublist = x.load_club_list()
+    print(len(clublist))
@@ -1,8 +1,8 @@
 """ TimeValidate Main Screen """
 
 import os
-import pandas as pd
 import logging
+from queue import Empty, SimpleQueue
 import customtkinter as ctk  # type: ignore
 import webbrowser
 
@@ -15,7 +15,7 @@ import pathlib
 # Appliction Specific Imports
 from config import appConfig
 from version import APP_VERSION
-from sdif_merge_core import SDIF_Merge
+from sdif_merge_core import MergeProgress, SDIF_Merge, SDIF_Watch
 
 tkContainer = Any
 
@@ -23,25 +23,50 @@ tkContainer = Any
 class TextHandler(logging.Handler):
     # This class allows you to log to a Tkinter Text or ScrolledText widget
     # Adapted from Moshe Kaplan: https://gist.github.com/moshekaplan/c425f861de7bbf28ef06
+    #
+    # Messages from any thread are queued and added to the widget in batches from the UI thread,
+    # one insert per batch, keeping only the last max_lines lines.
 
-    def __init__(self, text):
+    def __init__(self, text, interval: int = 100, max_lines: int = 2000):
         # run the regular Handler __init__
         logging.Handler.__init__(self)
         # Store a reference to the Text it will log to
         self.text = text
+        self._queue: SimpleQueue = SimpleQueue()
+        self._interval = interval
+        self._max_lines = max_lines
+        self.text.after(self._interval, self._drain)
 
     def emit(self, record):
-        msg = self.format(record)
-
-        def append():
-            self.text.configure(state="normal")
-            self.text.insert(tk.END, msg + "\n")
-            self.text.configure(state="disabled")
-            # Autoscroll to the bottom
-            self.text.yview(tk.END)
-
-        # This is necessary because we can't modify the Text from other threads
-        self.text.after(0, append)
+        try:
+            self._queue.put(self.format(record))
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+
+    def _drain(self) -> None:
+        """Add the queued messages to the widget - runs on the UI thread every interval ms"""
+        messages = []
+        while True:
+            try:
+                messages.append(self._queue.get_nowait())
+            except Empty:
+                break
+        if messages:
+            # Only the newest lines survive the trim, so older ones in a burst are never inserted
+            messages = messages[-self._max_lines :]
+            try:
+                self.text.configure(state="normal")
+                self.text.insert(tk.END, "\n".join(messages) + "\n")
+                lines = int(self.text.index("end-1c").split(".")[0]) - 1
+                if lines > self._max_lines:
+                    self.text.delete("1.0", f"{lines - self._max_lines + 1}.0")
+                self.text.configure(state="disabled")
+                # Autoscroll to the bottom
+                self.text.yview(tk.END)
+            except tk.TclError:
+                # The window has been closed
+                return
+        self.text.after(self._interval, self._drain)
 
 
 class _Splash_Fixes_Tab(ctk.CTkFrame):  # pylint: disable=too-many-ancestors
@@ -54,8 +79,12 @@ class _Splash_Fixes_Tab(ctk.CTkFrame):  # pylint: disable=too-many-ancestors
         self._entry_file_directory = StringVar(value=self._config.get_str("entry_file_directory"))
         self._output_sd3_file = StringVar(value=self._config.get_str("output_sd3_file"))
         self._output_report_file = StringVar(value=self._config.get_str("output_report_file"))
+        self._csv_file = StringVar(value=self._config.get_str("csv_file"))
         self._set_country = BooleanVar(value=self._config.get_bool("set_country"))
         self._set_region = BooleanVar(value=self._config.get_bool("set_region"))
+        self._watch_directory = BooleanVar(value=False)
+        self._watch_thread = None
+        self._merge_thread = None
 
         # self is a vertical container that will contain 3 frames
         self.columnconfigure(0, weight=1)
@@ -95,6 +124,13 @@ class _Splash_Fixes_Tab(ctk.CTkFrame):  # pylint: disable=too-many-ancestors
         btn3.grid(column=0, row=3, padx=20, pady=10)
         ctk.CTkLabel(filesframe, textvariable=self._output_report_file).grid(column=1, row=3, sticky="w", padx=(0, 10))
 
+        btn4 = ctk.CTkButton(filesframe, text="Club CSV File", command=self._handle_csv_file_browse)
+        btn4.grid(column=0, row=4, padx=20, pady=10)
+        ctk.CTkLabel(filesframe, textvariable=self._csv_file).grid(column=1, row=4, sticky="w", padx=(0, 10))
+        ctk.CTkButton(filesframe, text="Use Online List", width=110, command=self._handle_csv_file_clear).grid(
+            column=2, row=4, padx=(0, 10), pady=10
+        )
+
         # Right options frame for status options
 
         ctk.CTkLabel(right_optionsframe, text="Program Options").grid(column=0, row=0, sticky="nw", padx=10)
@@ -116,6 +152,31 @@ class _Splash_Fixes_Tab(ctk.CTkFrame):  # pylint: disable=too-many-ancestors
         self.merge_btn = ctk.CTkButton(buttonsframe, text="Merge SDIF Files", command=self._handle_merge_btn)
         self.merge_btn.grid(column=0, row=1, sticky="news", padx=20, pady=10)
 
+        # A manual merge and watch mode write the same files, so only one of them runs at a time
+        self.watch_switch = ctk.CTkSwitch(
+            buttonsframe,
+            text="Watch Directory",
+            variable=self._watch_directory,
+            onvalue=True,
+            offvalue=False,
+            command=self._handle_watch_directory,
+        )
+        self.watch_switch.grid(column=1, row=1, sticky="w", padx=20, pady=10)
+
+        self.merge_progress = ctk.CTkProgressBar(buttonsframe, orientation=HORIZONTAL)
+        self.merge_progress.grid(column=0, row=2, sticky="ew", padx=20, pady=(10, 0))
+        self.merge_progress.set(0)
+
+        self.cancel_btn = ctk.CTkButton(
+            buttonsframe, text="Cancel", width=110, state="disabled", command=self._handle_cancel_btn
+        )
+        self.cancel_btn.grid(column=1, row=2, sticky="w", padx=20, pady=(10, 0))
+
+        self._merge_status = StringVar(value="")
+        ctk.CTkLabel(buttonsframe, textvariable=self._merge_status).grid(
+            column=0, row=3, columnspan=2, sticky="w", padx=20, pady=(0, 10)
+        )
+
     def _handle_entry_file_directory_browse(self) -> None:
         entry_file_directory = filedialog.askdirectory(
             title="Entry File Directory", initialdir=self._entry_file_directory.get()
@@ -149,20 +210,84 @@ class _Splash_Fixes_Tab(ctk.CTkFrame):  # pylint: disable=too-many-ancestors
         self._config.set_str("output_report_file", output_report_file)
         self._output_report_file.set(output_report_file)
 
+    def _handle_csv_file_browse(self) -> None:
+        csv_file = filedialog.askopenfilename(
+            filetypes=[("CSV File", "*.csv")],
+            defaultextension=".csv",
+            title="Club CSV File",
+            initialfile=self._csv_file.get(),
+        )
+        if len(csv_file) == 0:
+            return
+        self._config.set_str("csv_file", csv_file)
+        self._csv_file.set(csv_file)
+
+    def _handle_csv_file_clear(self) -> None:
+        self._config.set_str("csv_file", "")
+        self._csv_file.set("")
+
     def _handle_merge_btn(self) -> None:
         self.merge_btn.configure(state="disabled")
+        self.watch_switch.configure(state="disabled")
+
+        self._merge_thread = SDIF_Merge(self._config)
+        self._merge_thread.start()
+        self.cancel_btn.configure(state="normal")
+        self.merge_progress.set(0)
+        self.monitor_merge_thread(self._merge_thread)
 
-        merge_thread = SDIF_Merge(self._config)
-        merge_thread.start()
-        self.monitor_merge_thread(merge_thread)
+    def _handle_cancel_btn(self) -> None:
+        if self._merge_thread is not None:
+            self._merge_thread.cancel()
+            self.cancel_btn.configure(state="disabled")
+            self._merge_status.set("Cancelling...")
 
     def monitor_merge_thread(self, thread):
         if thread.is_alive():
+            self._show_progress(thread.progress())
             # check the thread every 100ms
             self.after(100, lambda: self.monitor_merge_thread(thread))
         else:
-            self.merge_btn.configure(state="enabled")
+            if self._watch_thread is None:
+                self.merge_btn.configure(state="enabled")
+            self.watch_switch.configure(state="normal")
+            self.cancel_btn.configure(state="disabled")
             thread.join()
+            self._merge_thread = None
+            if thread.cancelled:
+                self.merge_progress.set(0)
+                self._merge_status.set("Merge cancelled - previous output kept")
+            else:
+                self._show_progress(thread.progress())
+                self._merge_status.set("Merge complete" if thread.success else "Merge failed - see the messages below")
+
+    def _show_progress(self, progress: MergeProgress) -> None:
+        """Show the progress of the running merge"""
+        self.merge_progress.set(progress.fraction)
+        status = f"{progress.files_done} of {progress.files_total} files, {progress.bytes_done / 1048576:.1f} MiB"
+        if progress.eta is not None and progress.files_done < progress.files_total:
+            status += f", about {progress.eta:.0f}s left"
+        self._merge_status.set(status)
+
+    def _handle_watch_directory(self) -> None:
+        if self._watch_directory.get():
+            self.merge_btn.configure(state="disabled")
+            self._watch_thread = SDIF_Watch(self._config)
+            self._watch_thread.start()
+        elif self._watch_thread is not None:
+            self._watch_thread.stop()
+            # Wait for a merge the watcher is running to stop before another one can be started
+            self.watch_switch.configure(state="disabled")
+            self.monitor_watch_thread(self._watch_thread)
+            self._watch_thread = None
+
+    def monitor_watch_thread(self, thread: SDIF_Watch) -> None:
+        if thread.is_alive():
+            # check the thread every 100ms
+            self.after(100, lambda: self.monitor_watch_thread(thread))
+        else:
+            self.merge_btn.configure(state="enabled")
+            self.watch_switch.configure(state="normal")
 
     def _handle_update_country(self) -> None:
         self._config.set_bool("set_country", self._set_country.get())
@@ -185,6 +310,13 @@ class _Configuration_Tab(ctk.CTkFrame):  # pylint: disable=too-many-ancestors
         self._ctk_theme = StringVar(value=self._config.get_str("Theme"))
         self._ctk_size = StringVar(value=self._config.get_str("Scaling"))
         self._ctk_colour = StringVar(value=self._config.get_str("Colour"))
+        self._dedup_policy = StringVar(value=self._config.get_str("dedup_policy"))
+        self._group_by_club = BooleanVar(value=self._config.get_bool("group_by_club"))
+        self._split_by_meet = BooleanVar(value=self._config.get_bool("split_by_meet"))
+        self._validation = StringVar(value=self._config.get_str("validation"))
+        self._stats_json = BooleanVar(value=self._config.get_bool("stats_json"))
+        self._include_subfolders = BooleanVar(value=self._config.get_bool("include_subfolders"))
+        self._zip_output = BooleanVar(value=self._config.get_bool("zip_output"))
 
         # self is a vertical container that will contain 3 frames
         self.columnconfigure(0, weight=1)
@@ -232,6 +364,71 @@ class _Configuration_Tab(ctk.CTkFrame):  # pylint: disable=too-many-ancestors
             variable=self._ctk_colour,
         ).grid(row=3, column=0, padx=20, pady=10)
 
+        # Merge Options on the right frame
+
+        ctk.CTkLabel(right_optionsframe, text="Merge Options").grid(column=0, row=0, sticky="w", padx=10)
+
+        ctk.CTkLabel(right_optionsframe, text="Duplicate Entries", anchor="w").grid(row=1, column=1, sticky="w")
+        ctk.CTkOptionMenu(
+            right_optionsframe,
+            values=["off", "first", "newest", "fastest"],
+            command=self.change_dedup_policy_event,
+            variable=self._dedup_policy,
+        ).grid(row=1, column=0, padx=20, pady=10)
+
+        ctk.CTkSwitch(
+            right_optionsframe,
+            text="Group Output by Club",
+            variable=self._group_by_club,
+            onvalue=True,
+            offvalue=False,
+            command=self.change_group_by_club_event,
+        ).grid(column=0, row=2, columnspan=2, sticky="w", padx=20, pady=10)
+
+        ctk.CTkSwitch(
+            right_optionsframe,
+            text="Separate File per Meet",
+            variable=self._split_by_meet,
+            onvalue=True,
+            offvalue=False,
+            command=self.change_split_by_meet_event,
+        ).grid(column=0, row=3, columnspan=2, sticky="w", padx=20, pady=10)
+
+        ctk.CTkLabel(right_optionsframe, text="Record Validation", anchor="w").grid(row=4, column=1, sticky="w")
+        ctk.CTkOptionMenu(
+            right_optionsframe,
+            values=["off", "report", "pad", "drop"],
+            command=self.change_validation_event,
+            variable=self._validation,
+        ).grid(row=4, column=0, padx=20, pady=10)
+
+        ctk.CTkSwitch(
+            right_optionsframe,
+            text="Write Statistics JSON File",
+            variable=self._stats_json,
+            onvalue=True,
+            offvalue=False,
+            command=self.change_stats_json_event,
+        ).grid(column=0, row=5, columnspan=2, sticky="w", padx=20, pady=10)
+
+        ctk.CTkSwitch(
+            right_optionsframe,
+            text="Include Subfolders",
+            variable=self._include_subfolders,
+            onvalue=True,
+            offvalue=False,
+            command=self.change_include_subfolders_event,
+        ).grid(column=0, row=6, columnspan=2, sticky="w", padx=20, pady=10)
+
+        ctk.CTkSwitch(
+            right_optionsframe,
+            text="Zip Output and Report",
+            variable=self._zip_output,
+            onvalue=True,
+            offvalue=False,
+            command=self.change_zip_output_event,
+        ).grid(column=0, row=7, columnspan=2, sticky="w", padx=20, pady=10)
+
     def change_appearance_mode_event(self, new_appearance_mode: str):
         ctk.set_appearance_mode(new_appearance_mode)
         self._config.set_str("Theme", new_appearance_mode)
@@ -241,6 +438,27 @@ class _Configuration_Tab(ctk.CTkFrame):  # pylint: disable=too-many-ancestors
         ctk.set_widget_scaling(new_scaling_float)
         self._config.set_str("Scaling", new_scaling)
 
+    def change_dedup_policy_event(self, new_policy: str) -> None:
+        self._config.set_str("dedup_policy", new_policy)
+
+    def change_validation_event(self, new_validation: str) -> None:
+        self._config.set_str("validation", new_validation)
+
+    def change_stats_json_event(self) -> None:
+        self._config.set_bool("stats_json", self._stats_json.get())
+
+    def change_group_by_club_event(self) -> None:
+        self._config.set_bool("group_by_club", self._group_by_club.get())
+
+    def change_split_by_meet_event(self) -> None:
+        self._config.set_bool("split_by_meet", self._split_by_meet.get())
+
+    def change_include_subfolders_event(self) -> None:
+        self._config.set_bool("include_subfolders", self._include_subfolders.get())
+
+    def change_zip_output_event(self) -> None:
+        self._config.set_bool("zip_output", self._zip_output.get())
+
     def change_colour_event(self, new_colour: str) -> None:
         logging.info("Changing colour to : " + new_colour)
         ctk.set_default_color_theme(new_colour)
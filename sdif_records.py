@@ -0,0 +1,212 @@
+"""SDIF record layouts
+
+Field layouts of the fixed width records in SDIF (SD3) files.  Layouts follow
+the USA Swimming SDIF v3 specification and are given here once as
+(name, start, length, kind) with the 1-based start column of the
+specification.  They are compiled to 0-based slices when this module is
+imported.  The merge and the validation work on the raw records through these
+slices, so a field is only decoded where it is used.
+"""
+
+from typing import Dict, NamedTuple, Optional, Tuple
+
+# SDIF records are fixed width
+RECORD_LENGTH = 160
+
+# Field kinds, which select the characters a field is validated against
+CODE = "code"  # Code or text
+INT = "int"  # Number, blank when not given
+DATE = "date"  # MMDDYYYY date, blank when not given
+TIME = "time"  # Swim time [mm:]ss.hh, or blank, NT, NS, DQ or SCR
+
+# Fields common to all records
+_COMMON = (
+    ("record_type", 1, 2, CODE),
+    ("org_code", 3, 1, CODE),
+)
+
+# Field layouts by record type
+_LAYOUTS = {
+    b"A0": (
+        ("sdif_version", 4, 8, CODE),
+        ("file_code", 12, 2, CODE),
+        ("software_name", 44, 20, CODE),
+        ("software_version", 64, 10, CODE),
+        ("contact_name", 74, 20, CODE),
+        ("contact_phone", 94, 12, CODE),
+        ("creation_date", 106, 8, DATE),
+        ("submitted_by_lsc", 156, 2, CODE),
+    ),
+    b"B1": (
+        ("meet_name", 12, 30, CODE),
+        ("address_1", 42, 22, CODE),
+        ("address_2", 64, 22, CODE),
+        ("city", 86, 20, CODE),
+        ("state", 106, 2, CODE),
+        ("postal_code", 108, 10, CODE),
+        ("country", 118, 3, CODE),
+        ("meet_code", 121, 1, CODE),
+        ("start_date", 122, 8, DATE),
+        ("end_date", 130, 8, DATE),
+        ("altitude", 138, 4, INT),
+        ("course", 150, 1, CODE),
+    ),
+    b"C1": (
+        ("lsc", 12, 2, CODE),
+        ("team", 14, 4, CODE),
+        ("team_code", 12, 6, CODE),
+        ("name", 18, 30, CODE),
+        ("short_name", 48, 16, CODE),
+        ("address_1", 64, 22, CODE),
+        ("address_2", 86, 22, CODE),
+        ("city", 108, 20, CODE),
+        ("state", 128, 2, CODE),
+        ("postal_code", 130, 10, CODE),
+        ("country", 140, 3, CODE),
+        ("region", 143, 1, CODE),
+        ("team_code_5", 150, 1, CODE),
+    ),
+    b"D0": (
+        ("name", 12, 28, CODE),
+        ("uss_number", 40, 12, CODE),
+        ("attach_code", 52, 1, CODE),
+        ("citizen", 53, 3, CODE),
+        ("birth_date", 56, 8, DATE),
+        ("age_class", 64, 2, CODE),
+        ("sex", 66, 1, CODE),
+        ("event_sex", 67, 1, CODE),
+        ("distance", 68, 4, INT),
+        ("stroke", 72, 1, CODE),
+        ("event_number", 73, 4, CODE),
+        ("event_age", 77, 4, CODE),
+        ("swim_date", 81, 8, DATE),
+        ("seed_time", 89, 8, TIME),
+        ("seed_course", 97, 1, CODE),
+        ("prelim_time", 98, 8, TIME),
+        ("prelim_course", 106, 1, CODE),
+        ("swim_off_time", 107, 8, TIME),
+        ("swim_off_course", 115, 1, CODE),
+        ("finals_time", 116, 8, TIME),
+        ("finals_course", 124, 1, CODE),
+        ("prelim_heat", 125, 2, INT),
+        ("prelim_lane", 127, 2, INT),
+        ("finals_heat", 129, 2, INT),
+        ("finals_lane", 131, 2, INT),
+        ("prelim_place", 133, 3, INT),
+        ("finals_place", 136, 3, INT),
+        ("points", 139, 4, CODE),
+        ("time_class", 143, 2, CODE),
+        ("flight_status", 145, 1, CODE),
+    ),
+    b"D3": (
+        ("uss_number", 3, 14, CODE),
+        ("preferred_first_name", 17, 15, CODE),
+        ("ethnicity", 32, 2, CODE),
+        ("junior_high_school", 34, 1, CODE),
+        ("senior_high_school", 35, 1, CODE),
+        ("ymca_ywca", 36, 1, CODE),
+        ("college", 37, 1, CODE),
+        ("summer_league", 38, 1, CODE),
+        ("masters", 39, 1, CODE),
+        ("disabled", 40, 1, CODE),
+        ("water_polo", 41, 1, CODE),
+        ("none", 42, 1, CODE),
+    ),
+    b"E0": (
+        ("relay_team_name", 12, 1, CODE),
+        ("team_code", 13, 6, CODE),
+        ("f0_count", 19, 2, INT),
+        ("event_sex", 21, 1, CODE),
+        ("distance", 22, 4, INT),
+        ("stroke", 26, 1, CODE),
+        ("event_number", 27, 4, CODE),
+        ("event_age", 31, 4, CODE),
+        ("total_age", 35, 3, INT),
+        ("swim_date", 38, 8, DATE),
+        ("seed_time", 46, 8, TIME),
+        ("seed_course", 54, 1, CODE),
+        ("prelim_time", 55, 8, TIME),
+        ("prelim_course", 63, 1, CODE),
+        ("swim_off_time", 64, 8, TIME),
+        ("swim_off_course", 72, 1, CODE),
+        ("finals_time", 73, 8, TIME),
+        ("finals_course", 81, 1, CODE),
+        ("prelim_heat", 82, 2, INT),
+        ("prelim_lane", 84, 2, INT),
+        ("finals_heat", 86, 2, INT),
+        ("finals_lane", 88, 2, INT),
+        ("prelim_place", 90, 3, INT),
+        ("finals_place", 93, 3, INT),
+        ("points", 96, 4, CODE),
+        ("time_class", 100, 2, CODE),
+    ),
+    b"F0": (
+        ("team_code", 16, 6, CODE),
+        ("relay_team_name", 22, 1, CODE),
+        ("name", 23, 28, CODE),
+        ("uss_number", 51, 12, CODE),
+        ("citizen", 63, 3, CODE),
+        ("birth_date", 66, 8, DATE),
+        ("age_class", 74, 2, CODE),
+        ("sex", 76, 1, CODE),
+        ("prelim_order", 77, 1, CODE),
+        ("swim_off_order", 78, 1, CODE),
+        ("finals_order", 79, 1, CODE),
+        ("leg_time", 80, 8, TIME),
+        ("course", 88, 1, CODE),
+        ("takeoff_time", 89, 4, CODE),
+        ("uss_number_new", 93, 14, CODE),
+        ("preferred_first_name", 107, 15, CODE),
+    ),
+    b"Z0": (
+        ("file_code", 12, 2, CODE),
+        ("notes", 14, 30, CODE),
+        ("b_records", 44, 3, INT),
+        ("meets", 47, 3, INT),
+        ("c_records", 50, 4, INT),
+        ("teams", 54, 4, INT),
+        ("d_records", 58, 6, INT),
+        ("swimmers", 64, 6, INT),
+        ("e_records", 70, 5, INT),
+        ("f_records", 75, 6, INT),
+        ("g_records", 81, 6, INT),
+        ("batch_number", 87, 5, INT),
+        ("new_members", 92, 3, INT),
+        ("renew_members", 95, 3, INT),
+        ("member_changes", 98, 3, INT),
+        ("member_deletes", 101, 3, INT),
+    ),
+}
+
+
+class Field(NamedTuple):
+    """A fixed width field, as a 0-based slice of the record"""
+
+    name: str
+    start: int
+    end: int
+    kind: str
+
+
+def _compile(layout: Tuple[Tuple[str, int, int, str], ...]) -> Dict[str, Field]:
+    return {name: Field(name, start - 1, start - 1 + length, kind) for name, start, length, kind in _COMMON + layout}
+
+
+# Compiled field tables by record type
+FIELDS: Dict[bytes, Dict[str, Field]] = {record_type: _compile(layout) for record_type, layout in _LAYOUTS.items()}
+
+
+def field_slice(record_type: bytes, name: str) -> slice:
+    """0-based slice of a field, for code that works on the raw records"""
+    field = FIELDS[record_type][name]
+    return slice(field.start, field.end)
+
+
+def decode_time(value: bytes) -> Optional[int]:
+    """Swim time in hundredths of a second from [mm:]ss.hh with an optional course letter"""
+    text = value.strip().decode("latin-1").rstrip("LSY")
+    try:
+        minutes, _, seconds = text.rpartition(":")
+        return round((int(minutes or 0) * 60 + float(seconds)) * 100)
+    except ValueError:
+        return None
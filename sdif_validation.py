@@ -0,0 +1,280 @@
+"""Validation of SDIF records before they are merged
+
+Checks every record of an SD3 stream for its length, a known record type and
+the contents of its numeric, date and time fields, plus the record order the
+SDIF specification requires (club C1 before its D0 entries, relay E0 before
+its F0 swimmers).
+
+The checks are made in one pass over the whole stream: a pattern for each
+record type is compiled from the field layouts in sdif_records, with a
+character class for each checked field, and a single regular expression match
+runs over the fixed width rows until a record does not fit.  The record order
+is part of the same match - there is a pattern for each combination of parent
+records (C1, E0) seen so far.  Only the records that fail are decoded to find
+out what is wrong with them, so a clean file costs one scan of its bytes.
+Records that are valid apart from being too short, as when an editor has
+trimmed their trailing blanks, are matched as a run by a second pattern and
+only their lengths are looked at.
+"""
+
+import itertools
+import mmap
+import re
+import sys
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from sdif_records import DATE, FIELDS, INT, RECORD_LENGTH, TIME
+
+# Record types defined by SDIF v3
+RECORD_TYPES = (b"D0", b"F0", b"E0", b"D3", b"C1", b"D1", b"D2", b"C2", b"G0", b"B1", b"B2", b"A0", b"Z0")
+
+# Characters allowed in each kind of field - numbers and dates are right justified or blank, times may be NT/NS/DQ/SCR
+_FIELD_CHARACTERS = {
+    INT: rb"[0-9 ]",
+    DATE: rb"[0-9 ]",
+    TIME: rb"[0-9:. NTSDQRC]",
+}
+
+# Fields checked by record type - the fields of an entry file that are read as numbers, dates or times.
+# Result fields (finals times, heats, places) are blank in entry files and the A0 and Z0 records are rewritten.
+CHECKED_FIELDS = {
+    b"B1": ("start_date", "end_date"),
+    b"D0": ("birth_date", "distance", "seed_time"),
+    b"E0": ("distance", "seed_time"),
+    b"F0": ("birth_date",),
+}
+
+# Possessive repeats (Python 3.11 and later) - once a record has matched, the match doesn't keep a point to
+# backtrack to for it, which makes it three times as fast.  The patterns never need to backtrack into a record.
+_POSSESSIVE = b"+" if sys.version_info >= (3, 11) else b""
+
+# Record orders to check - records of the first type must come after a record of the second
+_ORDER = ((b"D0", b"C1"), (b"F0", b"E0"))
+_PARENTS = {child: parent for child, parent in _ORDER}
+
+
+class RecordIssue(NamedTuple):
+    """A record that failed validation"""
+
+    source: str  # Input file (or zip member) the record was read from
+    line: int  # Line number in that input
+    record_type: str
+    message: str
+
+
+def _record_runs(record_type: bytes) -> List[Tuple[bytes, int]]:
+    """Character class and length of each run of same-class characters after the record type"""
+    # "." is any character except the line end, so a short record can't run into the next one.  The last
+    # character can't be a CR either, or a record one character short would pass with its CR LF as an LF.
+    classes = [b"."] * (RECORD_LENGTH - 1) + [rb"[^\r\n]"]
+    for name in CHECKED_FIELDS.get(record_type, ()):
+        field = FIELDS[record_type][name]
+        classes[field.start : field.end] = [_FIELD_CHARACTERS[field.kind]] * (field.end - field.start)
+    runs = []
+    run_start = 2
+    for position in range(3, RECORD_LENGTH + 1):
+        if position == RECORD_LENGTH or classes[position] != classes[run_start]:
+            runs.append((classes[run_start], position - run_start))
+            run_start = position
+    return runs
+
+
+def _record_pattern(record_type: bytes) -> bytes:
+    """Pattern matching one valid record of a type, without its line end"""
+    # Runs of the same class become one repeat
+    runs = _record_runs(record_type)
+    return re.escape(record_type) + b"".join(
+        cls + (b"{%d}" % count + _POSSESSIVE if count > 1 else b"") for cls, count in runs
+    )
+
+
+def _short_record_pattern(record_type: bytes) -> bytes:
+    """Pattern matching a record of a type that is too short, but otherwise valid once padded with blanks
+
+    Blanks are allowed in every checked field, so any start of a valid
+    record will do.  The longer branch of each run is tried first.
+    """
+    runs = _record_runs(record_type)
+    cls, count = runs[-1]
+    pattern = b"%s{0,%d}" % (cls, count - 1) if count > 1 else b""
+    for cls, count in reversed(runs[:-1]):
+        pattern = rb"(?:%s{%d}%s|%s{0,%d})" % (cls, count, pattern, cls, count - 1)
+    return re.escape(record_type) + pattern
+
+
+_RECORD_PATTERNS = {record_type: _record_pattern(record_type) for record_type in RECORD_TYPES}
+_SHORT_RECORD_PATTERNS = {record_type: _short_record_pattern(record_type) for record_type in RECORD_TYPES}
+
+
+def _any_record(record_types: Iterable[bytes], patterns: Dict[bytes, bytes] = _RECORD_PATTERNS) -> bytes:
+    return rb"(?:" + rb"|".join(patterns[record_type] for record_type in record_types) + rb")"
+
+
+def _stream_pattern(seen: FrozenSet[bytes], patterns: Dict[bytes, bytes] = _RECORD_PATTERNS) -> bytes:
+    """Pattern matching valid records, each ending with CR LF or LF, once the parent records in seen have been read"""
+    pending = [parent for child, parent in _ORDER if parent not in seen]
+    blocked = {child for child, parent in _ORDER if parent not in seen}.union(pending)
+    # The run can be possessive too - the parent record that may follow it is never one of its records
+    pattern = (
+        rb"(?:" + _any_record((t for t in RECORD_TYPES if t not in blocked), patterns) + rb"\r?\n)*" + _POSSESSIVE
+    )
+    if pending:
+        # The first parent record moves on to the pattern for the records that may follow it
+        following = (patterns[parent] + rb"\r?\n" + _stream_pattern(seen | {parent}, patterns) for parent in pending)
+        pattern += rb"(?:" + rb"|".join(following) + rb")?"
+    return pattern
+
+
+def _last_record_pattern(seen: FrozenSet[bytes]) -> bytes:
+    """Pattern matching a valid last record, which may have no line end"""
+    allowed = (t for t in RECORD_TYPES if t not in _PARENTS or _PARENTS[t] in seen)
+    return _any_record(allowed) + rb"\r?\n?\x1a?"
+
+
+# Compiled patterns for each combination of parent records seen
+_PARENT_STATES = [
+    frozenset(parents)
+    for count in range(len(_ORDER) + 1)
+    for parents in itertools.combinations(_PARENTS.values(), count)
+]
+_VALID_RECORDS = {seen: re.compile(_stream_pattern(seen)) for seen in _PARENT_STATES}
+_SHORT_RECORDS = {seen: re.compile(_stream_pattern(seen, _SHORT_RECORD_PATTERNS)) for seen in _PARENT_STATES}
+_VALID_LAST_RECORD = {seen: re.compile(_last_record_pattern(seen)) for seen in _PARENT_STATES}
+_ANY_RECORD = re.compile(_any_record(RECORD_TYPES))
+
+
+def _length_problem(length: int) -> str:
+    return f"record is {length} characters long, expected {RECORD_LENGTH}"
+
+
+class RecordValidator:
+    """Validates SD3 streams and optionally repairs them
+
+    The action decides what happens to records that fail:
+    report - records are only reported
+    pad - records of the wrong length are padded or cut to 160 characters, others are reported
+    drop - records that fail are left out of the merge
+    """
+
+    ACTIONS = ("report", "pad", "drop")
+
+    def __init__(self, action: str = "report"):
+        self.action = action
+
+    def check(self, data: Union[bytes, mmap.mmap], source: str) -> Tuple[List[RecordIssue], Optional[bytes]]:
+        """Validate the records of one SD3 stream
+
+        Returns the records that failed, and the repaired stream when the
+        action changed any records (None if the data is to be used as is).
+        """
+        size = len(data)
+        # Bad records - start, end and issue
+        bad: List[Tuple[int, int, RecordIssue]] = []
+        seen: FrozenSet[bytes] = frozenset()
+        pos = 0
+        line = 1
+        counted = 0
+        while True:
+            start = pos
+            pos = _VALID_RECORDS[seen].match(data, pos).end()
+            if pos >= size:
+                break
+            seen = self._parents_seen(data, start, pos, seen)
+            if _VALID_LAST_RECORD[seen].fullmatch(data, pos):
+                break
+            short_end = _SHORT_RECORDS[seen].match(data, pos).end()
+            if short_end > pos:
+                # Records that are only too short, such as ones with their trailing blanks trimmed, are
+                # common enough to be matched as a run rather than described one at a time
+                line += data[counted:pos].count(b"\n")
+                line = self._short_records(data, pos, short_end, line, source, bad)
+                seen = self._parents_seen(data, pos, short_end, seen)
+                counted = pos = short_end
+                continue
+            end = data.find(b"\n", pos) + 1 or size
+            record = data[pos:end].rstrip(b"\r\n")
+            if record.strip(b"\x1a \t"):
+                line += data[counted:pos].count(b"\n")
+                counted = pos
+                bad.append((pos, end, self._describe(record, source, line)))
+                if record[:2] in _PARENTS.values():
+                    seen = seen | {record[:2]}
+            pos = end
+
+        if not bad:
+            return [], None
+        issues = [issue for _, _, issue in bad]
+        if self.action == "report":
+            return issues, None
+        return issues, self._repair(data, bad)
+
+    @staticmethod
+    def _parents_seen(data, start: int, end: int, seen: FrozenSet[bytes]) -> FrozenSet[bytes]:
+        """Add the parent records found between start and end"""
+        for parent in _PARENTS.values():
+            if parent not in seen and (
+                data[start : start + 2] == parent or data.find(b"\n" + parent, start, end) >= 0
+            ):
+                seen = seen | {parent}
+        return seen
+
+    @staticmethod
+    def _short_records(data, start: int, end: int, line: int, source: str, bad: list) -> int:
+        """Add the too short records between start and end to bad, returning the line number after them"""
+        # A whole file of them is likely, so names and messages are only made once
+        names: Dict[bytes, str] = {}
+        problems: Dict[int, str] = {}
+        find = data.find
+        add = bad.append
+        pos = start
+        while pos < end:
+            record_end = find(b"\n", pos) + 1
+            length = record_end - pos - (2 if data[record_end - 2] == 13 else 1)
+            record_type = data[pos : pos + 2]
+            name = names.get(record_type) or names.setdefault(record_type, record_type.decode("latin-1"))
+            problem = problems.get(length) or problems.setdefault(length, _length_problem(length))
+            add((pos, record_end, RecordIssue(source, line, name, problem)))
+            line += 1
+            pos = record_end
+        return line
+
+    def _describe(self, record: bytes, source: str, line: int) -> RecordIssue:
+        """Work out what is wrong with a record that failed the pattern match"""
+        record_type = record[:2]
+        name = record_type.decode("latin-1")
+        if record_type not in RECORD_TYPES:
+            return RecordIssue(source, line, name, f"Unknown record type '{name}'")
+        if record_type in _PARENTS and _ANY_RECORD.fullmatch(record):
+            # A valid record in the wrong place
+            return RecordIssue(source, line, name, f"{name} record before any {_PARENTS[record_type].decode()} record")
+        problems = []
+        if len(record) != RECORD_LENGTH:
+            problems.append(_length_problem(len(record)))
+        padded = record[:RECORD_LENGTH].ljust(RECORD_LENGTH)
+        for field_name in CHECKED_FIELDS.get(record_type, ()):
+            field = FIELDS[record_type][field_name]
+            value = padded[field.start : field.end]
+            if not re.fullmatch(_FIELD_CHARACTERS[field.kind] + b"*", value):
+                problems.append(f"{field.name} is not a valid {field.kind}: '{value.decode('latin-1').strip()}'")
+        return RecordIssue(source, line, name, "; ".join(problems) or "Malformed record")
+
+    def _repair(self, data, bad: List[Tuple[int, int, RecordIssue]]) -> Optional[bytes]:
+        """Copy of the stream with the bad records padded or dropped"""
+        pieces = []
+        pos = 0
+        for start, end, _ in bad:
+            record = data[start:end]
+            body = record.rstrip(b"\r\n")
+            if self.action == "drop":
+                replacement = b""
+            elif len(body) != RECORD_LENGTH and body[:2] in RECORD_TYPES:
+                replacement = body[:RECORD_LENGTH].ljust(RECORD_LENGTH) + (record[len(body) :] or b"\r\n")
+            else:
+                continue
+            pieces.append(data[pos:start])
+            pieces.append(replacement)
+            pos = end
+        if not pieces:
+            return None
+        pieces.append(data[pos:])
+        return b"".join(pieces)
@@ -0,0 +1,111 @@
+"""Shared helpers for the merge tests - SDIF records built from the sdif_records layouts and a merge fixture"""
+
+import os
+from typing import Dict, List
+
+import pytest
+
+import config as config_module
+from config import appConfig
+from sdif_merge_core import SDIF_Merge
+from sdif_records import FIELDS, INT, RECORD_LENGTH, TIME
+
+
+def record(record_type: bytes, **values) -> bytes:
+    """One SDIF record, with the named fields set"""
+    data = bytearray(record_type + b"1".ljust(RECORD_LENGTH - 2))
+    fields = FIELDS[record_type]
+    for name, value in values.items():
+        field = fields[name]
+        width = field.end - field.start
+        text = str(value).encode("latin-1")[:width]
+        # Numbers and times are right justified, everything else left justified
+        data[field.start : field.end] = text.rjust(width) if field.kind in (INT, TIME) else text.ljust(width)
+    return bytes(data) + b"\r\n"
+
+
+def club(code: str, lsc: str = "ON", country: str = "CAN") -> bytes:
+    return record(b"C1", lsc=lsc, team=code, name=f"SWIM CLUB {code}", country=country)
+
+
+def entry(uss_number: str, distance: int = 100, stroke: str = "1", seed_time: str = "1:00.00") -> bytes:
+    return record(
+        b"D0",
+        name=f"SWIMMER {uss_number}",
+        uss_number=uss_number,
+        sex="F",
+        event_sex="F",
+        distance=distance,
+        stroke=stroke,
+        event_age="UNOV",
+        seed_time=seed_time,
+    )
+
+
+def relay(team: str, seed_time: str = "4:00.00") -> bytes:
+    return record(
+        b"E0",
+        relay_team_name="A",
+        team_code=team,
+        event_sex="F",
+        distance=400,
+        stroke="6",
+        event_age="UNOV",
+        seed_time=seed_time,
+    ) + b"".join(record(b"F0", team_code=team, relay_team_name="A", name=f"SWIMMER {leg}") for leg in range(4))
+
+
+def entry_file(*records: bytes, meet: str = "TEST MEET") -> bytes:
+    """An entry file holding records, between an A0/B1 header and a Z0"""
+    header = record(b"A0", sdif_version="V3", file_code="01") + record(b"B1", meet_name=meet, start_date="03012026")
+    return header + b"".join(records) + record(b"Z0", file_code="01")
+
+
+def records_of(data: bytes, record_type: bytes) -> List[bytes]:
+    """Records of a type in an SDIF file, without their line ends"""
+    return [line.rstrip(b"\r") for line in data.split(b"\n") if line.startswith(record_type)]
+
+
+def z0_counts(data: bytes) -> Dict[str, int]:
+    """Count fields of the Z0 trailer of a merged file"""
+    (z0,) = records_of(data, b"Z0")
+    return {
+        name: int(z0[field.start : field.end] or 0)
+        for name, field in FIELDS[b"Z0"].items()
+        if field.kind == INT and z0[field.start : field.end].strip()
+    }
+
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch) -> appConfig:
+    """Program settings kept in tmp_path, merging tmp_path/entries to tmp_path/output.sd3"""
+    monkeypatch.setattr(config_module, "user_config_dir", lambda *args: str(tmp_path / "config"))
+    settings = appConfig()
+    (tmp_path / "entries").mkdir()
+    settings.set_str("entry_file_directory", str(tmp_path / "entries"))
+    settings.set_str("output_sd3_file", str(tmp_path / "output.sd3"))
+    settings.set_str("output_report_file", str(tmp_path / "report.txt"))
+    settings.set_bool("set_country", False)
+    settings.set_bool("set_region", False)
+    settings.set_bool("incremental_merge", False)
+    settings.set_int("merge_workers", 2)
+    return settings
+
+
+def write_entries(settings: appConfig, files: Dict[str, bytes]) -> None:
+    """Write entry files, each one second newer than the one before"""
+    directory = settings.get_str("entry_file_directory")
+    for age, (name, data) in enumerate(reversed(list(files.items()))):
+        path = os.path.join(directory, name)
+        with open(path, "wb") as file:
+            file.write(data)
+        os.utime(path, (1_700_000_000 - age, 1_700_000_000 - age))
+
+
+def run_merge(settings: appConfig) -> bytes:
+    """Run a merge to completion and return the merged file"""
+    merge = SDIF_Merge(settings)
+    merge.run()
+    assert merge.success
+    with open(settings.get_str("output_sd3_file"), "rb") as file:
+        return file.read()
@@ -0,0 +1,76 @@
+"""Output files replacing their targets together"""
+
+import os
+
+import pytest
+
+from sdif_merge_core import _AtomicFiles
+
+
+@pytest.fixture
+def targets(tmp_path):
+    """Merged file and report of an earlier merge"""
+    output = tmp_path / "output.sd3"
+    report = tmp_path / "report.txt"
+    output.write_bytes(b"old output")
+    report.write_bytes(b"old report")
+    return output, report
+
+
+def write(outputs: _AtomicFiles, output, report) -> None:
+    with outputs:
+        outputs.open(str(report)).file.write(b"new report")
+        outputs.open(str(output)).file.write(b"new output")
+
+
+def leftovers(tmp_path):
+    return sorted(name for name in os.listdir(tmp_path) if name.endswith((".part", ".prev")))
+
+
+def test_targets_are_replaced_together(tmp_path, targets):
+    output, report = targets
+    write(_AtomicFiles(), output, report)
+
+    assert output.read_bytes() == b"new output"
+    assert report.read_bytes() == b"new report"
+    assert leftovers(tmp_path) == []
+
+
+def test_failed_block_leaves_the_targets(tmp_path, targets):
+    output, report = targets
+    outputs = _AtomicFiles()
+    with pytest.raises(RuntimeError):
+        with outputs:
+            outputs.open(str(report)).file.write(b"new report")
+            raise RuntimeError("merge failed")
+
+    assert output.read_bytes() == b"old output"
+    assert report.read_bytes() == b"old report"
+    assert leftovers(tmp_path) == []
+
+
+@pytest.mark.parametrize("existed", [True, False], ids=["replacing", "new"])
+def test_failed_rename_puts_back_the_replaced_targets(tmp_path, targets, monkeypatch, existed):
+    output, report = targets
+    if not existed:
+        output.unlink()
+        report.unlink()
+    replace = os.replace
+
+    def locked_output(source, target):
+        # The output is open in another program - the report is already replaced by now
+        if source == f"{output}.part":
+            raise PermissionError(13, "Permission denied", str(target))
+        replace(source, target)
+
+    monkeypatch.setattr(os, "replace", locked_output)
+    with pytest.raises(PermissionError):
+        write(_AtomicFiles(), output, report)
+
+    if existed:
+        assert output.read_bytes() == b"old output"
+        assert report.read_bytes() == b"old report"
+    else:
+        assert not output.exists()
+        assert not report.exists()
+    assert leftovers(tmp_path) == []
@@ -0,0 +1,76 @@
+"""Club list loading and caching"""
+
+import pytest
+
+from sdif_merge_core import ClubCSVCache, ClubRegistry
+
+
+def test_registry_indexes_clubs_by_code():
+    clubs = ClubRegistry.from_csv(["Club Name,Club Code,Province", "Ottawa,OTT,ON", "Laval,LAV,QC"])
+    assert len(clubs) == 2
+    assert clubs.province("OTT") == "ON"
+    assert clubs.province("XXX") is None
+
+
+def test_duplicate_club_codes_are_never_matched():
+    clubs = ClubRegistry.from_csv(["Club Code,Province", "OTT,ON", "OTT,QC", "LAV,QC"])
+    assert clubs.province("OTT") is None
+    assert clubs.duplicates == {"OTT"}
+
+
+def test_missing_club_code_column_gives_an_empty_registry():
+    assert len(ClubRegistry.from_csv(["Club Name,Province", "Ottawa,ON"])) == 0
+
+
+def test_rows_need_a_club_code_column():
+    with pytest.raises(ValueError):
+        ClubRegistry().add(["Ottawa", "ON"])
+
+
+class FakeResponse:
+    """Streamed download of a club list"""
+
+    def __init__(self, body: str, status_code: int = 200):
+        self.body = body
+        self.status_code = status_code
+        self.headers = {"ETag": '"1"'}
+        self.encoding = "utf-8"
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.closed = True
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self, decode_unicode=False):
+        return iter(self.body.splitlines())
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    """Responses for the club list downloads, in order"""
+    import requests
+
+    responses = []
+    monkeypatch.setattr(requests, "get", lambda *args, **kwargs: responses.pop(0))
+    return responses
+
+
+@pytest.mark.parametrize(
+    "body",
+    ["", "<html>Sign in to the network</html>", '"' + "x" * 200_000],
+    ids=["empty", "not a club list", "csv error"],
+)
+def test_cached_club_list_is_used_when_a_download_has_no_clubs(tmp_path, downloads, body):
+    cache = ClubCSVCache(str(tmp_path), ttl=0, timeout=1)
+    good = FakeResponse("Club Code,Province\nOTT,ON\n")
+    bad = FakeResponse(body)
+    downloads.extend([good, bad])
+
+    assert cache.load("https://example.com/clubs.csv").province("OTT") == "ON"
+    assert cache.load("https://example.com/clubs.csv").province("OTT") == "ON"
+    assert good.closed and bad.closed
@@ -0,0 +1,109 @@
+"""Duplicate clubs, entries and relays across entry files"""
+
+from typing import List
+
+import pytest
+
+from conftest import club, entry, entry_file, records_of, relay, run_merge, write_entries, z0_counts
+from sdif_records import FIELDS, field_slice
+
+_TEAM = field_slice(b"C1", "team")
+
+POLICIES = ("first", "newest", "fastest")
+
+
+@pytest.mark.parametrize("policy", POLICIES)
+def test_club_with_a_different_region_is_the_same_club(settings, policy):
+    # The second copy of the club has the wrong region, and only duplicate entries
+    write_entries(
+        settings,
+        {
+            "a.sd3": entry_file(club("ABCD", lsc="ON"), entry("A1"), entry("A2")),
+            "b.sd3": entry_file(club("ABCD", lsc="QC"), entry("A1"), entry("A2")),
+        },
+    )
+    settings.set_str("dedup_policy", policy)
+    merged = run_merge(settings)
+
+    assert len(records_of(merged, b"C1")) == 1
+    assert len(records_of(merged, b"D0")) == 2
+    assert z0_counts(merged)["teams"] == 1
+
+
+def seed_times(data: bytes, record_type: bytes = b"D0") -> List[str]:
+    field = FIELDS[record_type]["seed_time"]
+    return [line[field.start : field.end].decode("latin-1").strip() for line in records_of(data, record_type)]
+
+
+# The oldest copy is the slowest, the newest one neither the fastest nor the slowest
+COPIES = {
+    "a.sd3": ("1:10.00", "4:10.00"),
+    "b.sd3": ("1:00.00", "4:00.00"),
+    "c.sd3": ("1:05.00", "4:05.00"),
+}
+KEPT = {
+    "first": ("1:10.00", "4:10.00"),
+    "newest": ("1:05.00", "4:05.00"),
+    "fastest": ("1:00.00", "4:00.00"),
+}
+
+
+@pytest.mark.parametrize("policy", POLICIES)
+def test_policy_decides_which_copy_is_kept(settings, tmp_path, policy):
+    write_entries(
+        settings,
+        {
+            name: entry_file(club("ABCD"), entry("A1", seed_time=entry_time), relay("ABCD", relay_time))
+            for name, (entry_time, relay_time) in COPIES.items()
+        },
+    )
+    settings.set_str("dedup_policy", policy)
+    merged = run_merge(settings)
+
+    entry_time, relay_time = KEPT[policy]
+    assert seed_times(merged) == [entry_time]
+    assert seed_times(merged, b"E0") == [relay_time]
+    # The relay swimmers go with their relay
+    assert len(records_of(merged, b"F0")) == 4
+    assert [line[:2] for line in merged.splitlines()] == [b"A0", b"B1", b"C1", b"D0", b"E0"] + [b"F0"] * 4 + [b"Z0"]
+    report = (tmp_path / "report.txt").read_text()
+    assert "Clubs: 2\nIndividual entries: 2\nRelays: 2\n" in report
+
+
+def test_fastest_policy_keeps_a_seed_time_over_no_time(settings):
+    write_entries(
+        settings,
+        {
+            "a.sd3": entry_file(club("ABCD"), entry("A1", seed_time="NT")),
+            "b.sd3": entry_file(club("ABCD"), entry("A1", seed_time="9:59.99")),
+        },
+    )
+    settings.set_str("dedup_policy", "fastest")
+    assert seed_times(run_merge(settings)) == ["9:59.99"]
+
+
+@pytest.mark.parametrize("policy", ("newest", "fastest"))
+def test_club_is_written_with_its_winning_entries(settings, policy):
+    # The first file only has the losing copy of the entry - its club header must not be written on its own
+    write_entries(
+        settings,
+        {
+            "a.sd3": entry_file(club("ABCD"), entry("A1", seed_time="1:10.00")),
+            "b.sd3": entry_file(club("EFGH"), entry("E1")),
+            "c.sd3": entry_file(club("ABCD"), entry("A1", seed_time="1:00.00"), entry("A2")),
+        },
+    )
+    settings.set_str("dedup_policy", policy)
+    merged = run_merge(settings)
+
+    assert [line[:2] for line in merged.splitlines()[2:-1]] == [b"C1", b"D0", b"C1", b"D0", b"D0"]
+    assert [line[_TEAM].strip() for line in records_of(merged, b"C1")] == [b"EFGH", b"ABCD"]
+    assert seed_times(merged) == ["1:00.00", "1:00.00", "1:00.00"]
+
+
+def test_duplicates_are_kept_when_turned_off(settings):
+    write_entries(settings, {name: entry_file(club("ABCD"), entry("A1")) for name in COPIES})
+    merged = run_merge(settings)
+
+    assert len(records_of(merged, b"C1")) == 3
+    assert len(records_of(merged, b"D0")) == 3
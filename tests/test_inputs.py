@@ -0,0 +1,115 @@
+"""Streaming the members of nested zip files"""
+
+import io
+import os
+import zipfile
+from typing import Dict
+
+import pytest
+
+from conftest import club, entry, entry_file, records_of, run_merge
+from sdif_inputs import nested_members, stream_zip
+
+
+class Unseekable:
+    """Write only file - zipfile writes each member's sizes in a data descriptor after its data"""
+
+    def __init__(self):
+        self.data = io.BytesIO()
+
+    def write(self, data: bytes) -> int:
+        return self.data.write(data)
+
+    def flush(self) -> None:
+        pass
+
+
+def zip_bytes(members: Dict[str, bytes], method: int = zipfile.ZIP_DEFLATED, seekable: bool = True) -> bytes:
+    out = io.BytesIO() if seekable else Unseekable()
+    with zipfile.ZipFile(out, "w", method) as zfile:
+        for name, data in members.items():
+            zfile.writestr(name, data)
+    return out.getvalue() if seekable else out.data.getvalue()
+
+
+# Bigger than a streamed chunk, so members are decompressed in several steps
+MEMBERS = {"a.sd3": entry_file(*(entry(f"A{i}") for i in range(1000))), "b.sd3": entry_file(entry("B1"))}
+
+
+@pytest.mark.parametrize(
+    "method, seekable",
+    [(zipfile.ZIP_STORED, True), (zipfile.ZIP_DEFLATED, True), (zipfile.ZIP_DEFLATED, False)],
+    ids=["stored", "deflated", "data descriptor"],
+)
+def test_members_are_streamed_in_order(method, seekable):
+    members = stream_zip(io.BytesIO(zip_bytes(MEMBERS, method, seekable)))
+    for member, (name, data) in zip(members, MEMBERS.items()):
+        assert member.name == name
+        assert member.read() == data
+        assert (member.crc, member.size) == (zipfile.crc32(data), len(data))
+    assert next(members, None) is None
+
+
+@pytest.mark.parametrize("seekable", [True, False], ids=["sizes in header", "data descriptor"])
+def test_unread_members_are_skipped(seekable):
+    members = stream_zip(io.BytesIO(zip_bytes(MEMBERS, seekable=seekable)))
+    first = next(members)
+    first.read(100)
+    assert next(members).read() == MEMBERS["b.sd3"]
+
+
+def test_truncated_member_is_a_bad_zip_file():
+    data = zip_bytes(MEMBERS)
+    member = next(stream_zip(io.BytesIO(data[: len(data) // 2])))
+    with pytest.raises(zipfile.BadZipFile):
+        member.read()
+
+
+def test_corrupt_member_fails_its_crc_check():
+    data = zip_bytes(MEMBERS, zipfile.ZIP_STORED)
+    # Change one character of the first entry's data
+    pos = data.index(b"SWIMMER A0")
+    member = next(stream_zip(io.BytesIO(data[:pos] + b"X" + data[pos + 1 :])))
+    with pytest.raises(zipfile.BadZipFile, match="CRC"):
+        member.read()
+
+
+def test_member_compressed_with_another_method_can_only_be_skipped():
+    members = stream_zip(io.BytesIO(zip_bytes(MEMBERS, zipfile.ZIP_BZIP2)))
+    with pytest.raises(zipfile.BadZipFile, match="not supported"):
+        next(members).read()
+    assert next(members).name == "b.sd3"
+
+
+def test_members_of_a_zip_file_two_levels_down(tmp_path):
+    inner = zip_bytes(MEMBERS)
+    middle = zip_bytes({"inner.zip": inner}, zipfile.ZIP_STORED)
+    path = tmp_path / "bulk.zip"
+    path.write_bytes(zip_bytes({"middle.zip": middle}))
+
+    members = nested_members(str(path), ["middle.zip", "inner.zip"])
+    assert {member.name: member.read() for member in members} == MEMBERS
+
+
+def test_nested_members_are_merged_and_unsupported_ones_listed_as_skipped(settings, tmp_path):
+    inner = zip_bytes({"c.sd3": entry_file(club("IJKL"), entry("I1"))})
+    bzip2 = zip_bytes({"d.sd3": entry_file(club("MNOP"), entry("M1"))}, zipfile.ZIP_BZIP2)
+    lzma = zip_bytes({"e.sd3": entry_file(club("QRST"), entry("Q1"))}, zipfile.ZIP_LZMA)
+    bulk = {
+        "a.sd3": entry_file(club("ABCD"), entry("A1")),
+        "b.zip": zip_bytes({"b.sd3": entry_file(club("EFGH"), entry("E1")), "inner.zip": inner}, seekable=False),
+        "bzip2.zip": bzip2,
+        "lzma.zip": lzma,
+    }
+    path = os.path.join(settings.get_str("entry_file_directory"), "bulk.zip")
+    with open(path, "wb") as file:
+        file.write(zip_bytes(bulk))
+    merged = run_merge(settings)
+
+    assert len(records_of(merged, b"D0")) == 3
+    report = (tmp_path / "report.txt").read_text()
+    skipped = report.split("Files Skipped:\n\n")[1].split("\n\n")[0].splitlines()
+    assert skipped == [
+        "d.sd3 in zip file: bulk.zip/bzip2.zip: bzip2 compression is not supported in nested zips",
+        "e.sd3 in zip file: bulk.zip/lzma.zip: lzma compression is not supported in nested zips",
+    ]
@@ -0,0 +1,56 @@
+"""Merging entry files into one SD3 file"""
+
+import os
+
+from conftest import club, entry, entry_file, records_of, run_merge, write_entries
+from sdif_merge_core import SDIF_Merge
+
+
+def test_blank_lines_and_end_of_file_mark_are_left_out(settings, tmp_path):
+    first = entry_file(club("ABCD"), entry("A1"), b"\r\n", entry("A2")) + b"\x1a"
+    second = entry_file(club("EFGH"), b"\n", entry("E1")) + b"\r\n\x1a\r\n"
+    write_entries(settings, {"a.sd3": first, "b.sd3": second})
+    merged = run_merge(settings)
+
+    lines = merged.split(b"\r\n")
+    assert lines[-1] == b""
+    assert all(len(line) == 160 for line in lines[:-1])
+    assert len(records_of(merged, b"D0")) == 3
+    report = (tmp_path / "report.txt").read_text()
+    records_written = report.split("Records Written:")[1].split("Swimmers:")[0].strip().splitlines()
+    assert [line.split()[:2] for line in records_written] == [
+        ["A0", "1"],
+        ["B1", "1"],
+        ["C1", "2"],
+        ["D0", "3"],
+        ["Z0", "1"],
+    ]
+    assert all(line.endswith(" records/sec") for line in records_written)
+
+
+def test_split_by_meet_leaves_out_only_its_own_outputs(settings, tmp_path):
+    entries = tmp_path / "entries"
+    settings.set_str("output_sd3_file", str(entries / "output.sd3"))
+    settings.set_bool("split_by_meet", True)
+    write_entries(
+        settings,
+        {
+            "a.sd3": entry_file(club("ABCD"), entry("A1"), meet="SPRING"),
+            "b.sd3": entry_file(club("EFGH"), entry("E1"), meet="FALL"),
+            # Named like a per-meet output, but not one
+            "output_x.sd3": entry_file(club("IJKL"), entry("I1"), meet="SPRING"),
+        },
+    )
+    for _ in range(2):
+        # The second merge finds the per-meet outputs of the first in the entry file directory
+        merge = SDIF_Merge(settings)
+        merge.run()
+        assert merge.success
+        assert sorted(os.path.basename(name) for name in merge.output_files) == [
+            "output_FALL_03012026.sd3",
+            "output_SPRING_03012026.sd3",
+        ]
+        spring = (entries / "output_SPRING_03012026.sd3").read_bytes()
+        assert len(records_of(spring, b"D0")) == 2
+        fall = (entries / "output_FALL_03012026.sd3").read_bytes()
+        assert len(records_of(fall, b"D0")) == 1
@@ -0,0 +1,89 @@
+"""Incremental merges - reusing the processed records of unchanged entry files"""
+
+import os
+from typing import List
+
+import pytest
+
+from conftest import club, entry, entry_file, records_of, run_merge, write_entries
+from sdif_merge_core import SDIF_Merge
+
+FILES = {
+    "a.sd3": entry_file(club("ABCD"), entry("A1"), entry("A2")),
+    "b.sd3": entry_file(club("EFGH"), entry("E1")),
+}
+
+
+@pytest.fixture
+def reads(settings, monkeypatch) -> List[str]:
+    """Labels of the inputs read and split by each merge, instead of taken from the cache"""
+    read_input = SDIF_Merge._read_input
+    labels: List[str] = []
+
+    def record_read(self, directory, item, *args):
+        labels.append(item.label)
+        return read_input(self, directory, item, *args)
+
+    monkeypatch.setattr(SDIF_Merge, "_read_input", record_read)
+    settings.set_bool("incremental_merge", True)
+    return labels
+
+
+def touch(settings, name: str) -> None:
+    path = os.path.join(settings.get_str("entry_file_directory"), name)
+    mtime = os.stat(path).st_mtime + 60
+    os.utime(path, (mtime, mtime))
+
+
+def test_unchanged_files_are_taken_from_the_cache(settings, reads):
+    write_entries(settings, FILES)
+    first = run_merge(settings)
+    assert sorted(reads) == ["a.sd3", "b.sd3"]
+
+    reads.clear()
+    assert run_merge(settings) == first
+    assert reads == []
+
+
+def test_touched_file_with_the_same_content_is_taken_from_the_cache(settings, reads):
+    write_entries(settings, FILES)
+    first = run_merge(settings)
+    touch(settings, "a.sd3")
+
+    reads.clear()
+    assert run_merge(settings) == first
+    assert reads == []
+
+
+def test_changed_file_is_read_again(settings, reads):
+    write_entries(settings, FILES)
+    run_merge(settings)
+    write_entries(settings, {**FILES, "b.sd3": entry_file(club("EFGH"), entry("E1"), entry("E2"))})
+
+    reads.clear()
+    merged = run_merge(settings)
+    assert reads == ["b.sd3"]
+    assert len(records_of(merged, b"D0")) == 4
+
+
+def test_changed_settings_read_every_file_again(settings, reads):
+    write_entries(settings, FILES)
+    run_merge(settings)
+    settings.set_str("dedup_policy", "first")
+
+    reads.clear()
+    run_merge(settings)
+    assert sorted(reads) == ["a.sd3", "b.sd3"]
+
+
+def test_padded_file_is_recognised_by_its_content_as_read(settings, reads):
+    # The cache entry of a repaired input holds the hash of the file on disk, not of the padded copy
+    short_entry = entry("A2")[:150] + b"\r\n"
+    write_entries(settings, {**FILES, "a.sd3": entry_file(club("ABCD"), entry("A1"), short_entry)})
+    settings.set_str("validation", "pad")
+    first = run_merge(settings)
+    touch(settings, "a.sd3")
+
+    reads.clear()
+    assert run_merge(settings) == first
+    assert reads == []
@@ -0,0 +1,48 @@
+"""Record validation before the merge"""
+
+from conftest import club, entry, entry_file
+
+from sdif_validation import RecordValidator
+
+
+def test_clean_file_has_no_issues():
+    data = entry_file(club("ABCD"), entry("A1"), entry("A2"))
+    assert RecordValidator().check(data, "a.sd3") == ([], None)
+
+
+def test_short_records_are_reported_with_their_length():
+    records = entry_file(club("ABCD"), entry("A1"), entry("A2")).split(b"\r\n")
+    # Trailing blanks trimmed
+    records[3] = records[3].rstrip()
+    records[4] = records[4][:100]
+    issues, repaired = RecordValidator().check(b"\r\n".join(records), "a.sd3")
+
+    assert [(issue.line, issue.record_type, issue.message) for issue in issues] == [
+        (4, "D0", f"record is {len(records[3])} characters long, expected 160"),
+        (5, "D0", "record is 100 characters long, expected 160"),
+    ]
+    assert repaired is None
+
+
+def test_record_one_character_short_is_not_taken_for_a_cr():
+    # Its CR LF could pass as the last character and an LF
+    records = entry_file(club("ABCD"), entry("A1"), entry("A2")).split(b"\r\n")
+    records[3] = records[3][:159]
+    issues, _ = RecordValidator().check(b"\r\n".join(records), "a.sd3")
+    assert [(issue.line, issue.message) for issue in issues] == [(4, "record is 159 characters long, expected 160")]
+
+
+def test_pad_repairs_short_records():
+    records = entry_file(club("ABCD"), entry("A1")).split(b"\r\n")
+    padded = records[3]
+    records[3] = records[3].rstrip()
+    issues, repaired = RecordValidator("pad").check(b"\r\n".join(records), "a.sd3")
+
+    assert len(issues) == 1
+    assert repaired.split(b"\r\n")[3] == padded
+
+
+def test_entry_before_its_club_is_reported():
+    data = entry_file(entry("A1"), club("ABCD"), entry("A2"))
+    issues, _ = RecordValidator().check(data, "a.sd3")
+    assert [(issue.line, issue.message) for issue in issues] == [(3, "D0 record before any C1 record")]
@@ -0,0 +1,72 @@
+"""Watch mode re-merges"""
+
+import time
+
+import sdif_merge_core
+from conftest import club, entry, entry_file, write_entries
+from sdif_merge_core import SDIF_Watch
+
+
+def wait_for(condition, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_failed_merge_is_not_counted_as_merged(settings, tmp_path, monkeypatch):
+    results = []
+    merge_sdif_files = sdif_merge_core.SDIF_Merge.merge_sdif_files
+
+    def record_result(self, directory, output_file):
+        results.append(merge_sdif_files(self, directory, output_file))
+        return results[-1]
+
+    monkeypatch.setattr(sdif_merge_core.SDIF_Merge, "merge_sdif_files", record_result)
+    settings.set_float("watch_interval", 0.01)
+    settings.set_float("watch_debounce", 0.0)
+    # No club list - a merge that sets the country code fails
+    settings.set_str("csv_file", str(tmp_path / "missing.csv"))
+    settings.set_bool("set_country", True)
+    write_entries(settings, {"a.sd3": entry_file(club("ABCD"), entry("A1"))})
+
+    watch = SDIF_Watch(settings)
+    watch.start()
+    try:
+        wait_for(lambda: results)
+        assert results == [False]
+        assert watch.merges == 0
+
+        # Once the entry files change the merge is tried again
+        settings.set_bool("set_country", False)
+        write_entries(settings, {"a.sd3": entry_file(club("ABCD"), entry("A1")), "b.sd3": entry_file(club("EFGH"))})
+        wait_for(lambda: watch.merges == 1)
+        assert results == [False, True]
+        assert (tmp_path / "output.sd3").exists()
+    finally:
+        watch.stop()
+        watch.join()
+
+
+def test_per_meet_outputs_do_not_trigger_a_merge(settings, tmp_path):
+    settings.set_float("watch_interval", 0.01)
+    settings.set_float("watch_debounce", 0.0)
+    settings.set_str("output_sd3_file", str(tmp_path / "entries" / "output.sd3"))
+    settings.set_bool("split_by_meet", True)
+    write_entries(
+        settings,
+        {
+            "a.sd3": entry_file(club("ABCD"), entry("A1"), meet="SPRING"),
+            "b.sd3": entry_file(club("EFGH"), entry("E1"), meet="FALL"),
+        },
+    )
+
+    watch = SDIF_Watch(settings)
+    watch.start()
+    try:
+        wait_for(lambda: watch.merges == 1)
+        time.sleep(0.2)
+        assert watch.merges == 1
+    finally:
+        watch.stop()
+        watch.join()